@@ -0,0 +1,195 @@
+import numpy as np
+
+# Keys of hashed tables are 64-bit, the zero key marks empty slots
+KEY_MASK = (1 << 64) - 1
+
+# Key stored in place of the zero key, which is -1 reduced to 64 bits,
+# a value hash() never returns
+ZERO_KEY = KEY_MASK
+
+# Multiplier spreading the keys over the slots (Fibonacci hashing)
+HASH_MUL = 0x9E3779B97F4A7C15
+
+def combine_key(key, value):
+    """
+    Combine a key with an integer into another 64-bit key, e.g. the hash
+    of a state with an action, without going through hash(), whose values
+    may differ between processes
+    """
+
+    return (key ^ (value + 1) * HASH_MUL) & KEY_MASK
+
+class CountTable:
+    """
+    Dense table of visit counts, indexed by tuples of integers within
+    a fixed shape, e.g. (x, y) positions or (x, y, dir, action) pairs
+    """
+
+    def __init__(self, shape, dtype=np.uint32):
+        self.counts = np.zeros(shape, dtype=dtype)
+
+    def __getitem__(self, index):
+        return self.counts.item(index)
+
+    def __len__(self):
+        """
+        Number of entries visited at least once
+        """
+
+        return int(np.count_nonzero(self.counts))
+
+    def increment(self, index):
+        """
+        Increment the count of an entry, returns the new count
+        """
+
+        count = self.counts.item(index) + 1
+        self.counts[index] = count
+
+        return count
+
+    def total(self):
+        return int(self.counts.sum(dtype=np.uint64))
+
+    def merge(self, other):
+        """
+        Add the counts of another table of the same shape
+        """
+
+        assert self.counts.shape == other.counts.shape
+        self.counts += other.counts
+
+    def clear(self):
+        self.counts[...] = 0
+
+    def save(self, path):
+        np.savez(path, counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            counts = data['counts']
+
+        table = cls(counts.shape, dtype=counts.dtype)
+        table.counts[...] = counts
+
+        return table
+
+class HashedCountTable:
+    """
+    Sparse table of visit counts, indexed by integer keys such as state
+    hashes. Keys are reduced to 64 bits and stored in an open addressing
+    hash table with linear probing, which doubles in capacity when more
+    than `max_load` of its slots are taken.
+    """
+
+    def __init__(self, capacity=1 << 16, max_load=0.5, dtype=np.uint32):
+        assert capacity > 0 and capacity & (capacity - 1) == 0, 'capacity must be a power of 2'
+        self.max_load = max_load
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.counts = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.counts.item(self._slot(key)[0])
+
+    @property
+    def capacity(self):
+        return len(self.keys)
+
+    def _slot(self, key):
+        """
+        Find the slot holding a key, or the empty slot where it goes,
+        returns the slot and the key as stored
+        """
+
+        key &= KEY_MASK
+        if key == 0:
+            key = ZERO_KEY
+
+        keys = self.keys
+        mask = len(keys) - 1
+        shift = 64 - mask.bit_length()
+        i = ((key * HASH_MUL) & KEY_MASK) >> shift
+
+        for _ in range(len(keys)):
+            k = keys.item(i)
+            if k == key or k == 0:
+                return i, key
+            i = (i + 1) & mask
+
+        raise RuntimeError('count table is full')
+
+    def increment(self, key, value=1):
+        """
+        Increment the count of a key, returns the new count
+        """
+
+        i, key = self._slot(key)
+
+        if self.keys.item(i) == 0:
+            if self.size + 1 > self.max_load * len(self.keys):
+                self._resize(2 * len(self.keys))
+                i, key = self._slot(key)
+            self.keys[i] = key
+            self.size += 1
+
+        count = self.counts.item(i) + value
+        self.counts[i] = count
+
+        return count
+
+    def _resize(self, capacity):
+        keys, counts = self.keys, self.counts
+        used = keys != 0
+
+        self.keys = np.zeros(capacity, dtype=keys.dtype)
+        self.counts = np.zeros(capacity, dtype=counts.dtype)
+        self.size = 0
+
+        for key, count in zip(keys[used].tolist(), counts[used].tolist()):
+            self.increment(key, count)
+
+    def items(self):
+        """
+        Get the (key, count) pairs of the table, keys as stored
+        """
+
+        used = self.keys != 0
+        return zip(self.keys[used].tolist(), self.counts[used].tolist())
+
+    def total(self):
+        return int(self.counts.sum(dtype=np.uint64))
+
+    def merge(self, other):
+        """
+        Add the counts of another hashed table
+        """
+
+        for key, count in other.items():
+            self.increment(key, count)
+
+    def clear(self):
+        self.keys[:] = 0
+        self.counts[:] = 0
+        self.size = 0
+
+    def save(self, path):
+        np.savez(path, keys=self.keys, counts=self.counts, max_load=self.max_load)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            keys, counts = data['keys'], data['counts']
+            max_load = float(data['max_load'])
+
+        table = cls(capacity=len(keys), dtype=counts.dtype)
+        table.max_load = max_load
+        table.keys[:] = keys
+        table.counts[:] = counts
+        table.size = int(np.count_nonzero(keys))
+
+        return table
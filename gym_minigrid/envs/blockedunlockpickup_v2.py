@@ -12,6 +12,16 @@ class BlockedUnlockPickupV2(RoomGrid):
     in another room
     """
 
+    state_attrs = [
+        'obj',
+        'box',
+        'door',
+        'key',
+        'the_ball',
+        'blocked_pos',
+        '_carrying',
+    ]
+
     def __init__(self, seed=None, full_task=False, with_reward=False, num_rows=2,
                  reward_ball=False, see_through_walls=True, agent_view_size=7,
                  reset_on_intent=False):
@@ -57,7 +67,7 @@ class BlockedUnlockPickupV2(RoomGrid):
         # Generate a new random grid at the start of each episode
         # To keep the same grid for each episode, call env.seed() with
         # the same seed before calling env.reset()
-        self._gen_grid(self.width, self.height)
+        self._gen_layout()
 
         # These fields should be defined by _gen_grid
         assert self.agent_pos is not None
@@ -245,53 +255,21 @@ class BlockedUnlockPickupEGOV3(BlockedUnlockPickupV2):
 
         return (topX, topY, botX, botY)
 
-    def gen_obs_grid(self):
-        """
-        Generate the sub-grid observed by the agent.
-        This method also outputs a visibility mask telling us which grid
-        cells the agent can actually see.
-        """
-
-        topX, topY, botX, botY = self.get_view_exts()
-
-        grid = self.grid.slice(topX, topY, self.agent_view_size, self.agent_view_size)
-
-        for i in range(self.agent_dir + 1):
-            grid = grid.rotate_left()
-
-        # Process occluders and visibility
-        # Note that this incurs some performance cost
-        if not self.see_through_walls:
-            vis_mask = grid.process_vis(agent_pos=(self.agent_view_size // 2 ,
-                                                   self.agent_view_size // 2))
-        else:
-            vis_mask = np.ones(shape=(grid.width, grid.height), dtype=np.bool)
-
-        # Make it so the agent sees what it's carrying
-        # We do this by placing the carried object at the agent's position
-        # in the agent's partially observable view
-        agent_pos = grid.width // 2, grid.height // 2
-        if self.carrying:
-            grid.set(*agent_pos, self.carrying)
-        else:
-            grid.set(*agent_pos, None)
-
-        return grid, vis_mask
+    def get_view_agent_pos(self):
+        return (self.agent_view_size // 2, self.agent_view_size // 2)
 
     def get_obs_render(self, obs, tile_size=TILE_PIXELS//2):
         """
         Render an agent observation for visualization
         """
 
-        grid, vis_mask = Grid.decode(obs)
-        vis_mask.fill(True)
-
-        # Render the whole grid
-        img = grid.render(
+        # Render the whole view, highlighting all of it
+        img = Grid.render_encoding(
+            obs,
             tile_size,
-            agent_pos=(self.agent_view_size // 2, self.agent_view_size // 2),
+            agent_pos=self.get_view_agent_pos(),
             agent_dir=3,
-            highlight_mask=vis_mask
+            highlight_mask=np.ones(shape=obs.shape[:2], dtype=bool)
         )
 
         return img
@@ -39,8 +39,8 @@ class DistShiftEnv(MiniGridEnv):
 
         # Place the lava rows
         for i in range(self.width - 6):
-            self.grid.set(3+i, 1, Lava())
-            self.grid.set(3+i, self.strip2_row, Lava())
+            self.grid.set(3+i, 1, Lava.shared())
+            self.grid.set(3+i, self.strip2_row, Lava.shared())
 
         # Place the agent
         if self.agent_start_pos is not None:
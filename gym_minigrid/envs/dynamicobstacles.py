@@ -7,6 +7,8 @@ class DynamicObstaclesEnv(MiniGridEnv):
     Single-room square grid environment with moving obstacles
     """
 
+    state_attrs = ['obstacles']
+
     def __init__(
             self,
             size=8,
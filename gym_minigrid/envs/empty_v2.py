@@ -11,6 +11,11 @@ class EmptyEnvV2(MiniGridEnv):
     Empty grid environment, no obstacles, sparse reward
     """
 
+    # Goal positions are drawn from the global numpy RNG
+    seeded_layouts = False
+
+    state_attrs = ['_crt_goal_pos']
+
     def __init__(
         self,
         size=16,
@@ -96,6 +101,12 @@ class EmptyOODEnvV0(MiniGridEnv):
     """
     Empty grid environment, no obstacles, sparse reward
     """
+
+    # Goal positions are drawn from the global numpy RNG
+    seeded_layouts = False
+
+    state_attrs = ['_crt_goal_pos']
+
     def __init__(
         self,
         size=16,
@@ -193,6 +204,11 @@ class EmptyOODEnvV1(MiniGridEnv):
     Empty grid environment, no obstacles, sparse reward
     """
 
+    # Goal positions are drawn from the global numpy RNG
+    seeded_layouts = False
+
+    state_attrs = ['_crt_goal_pos']
+
     def __init__(
         self,
         size=16,
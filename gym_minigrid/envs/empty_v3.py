@@ -21,6 +21,11 @@ class EmptySeqEnvV0(MiniGridEnv):
     Empty grid environment, no obstacles, sparse reward
     """
 
+    # Goal positions are drawn from the global numpy RNG
+    seeded_layouts = False
+
+    state_attrs = ['_crt_goal_pos']
+
     def __init__(
         self,
         size=16,
@@ -7,6 +7,8 @@ class FetchEnv(MiniGridEnv):
     named using English text strings
     """
 
+    state_attrs = ['targetColor', 'targetType']
+
     def __init__(
         self,
         size=8,
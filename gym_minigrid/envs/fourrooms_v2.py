@@ -12,6 +12,9 @@ class FourRoomsEnv2(MiniGridEnv):
     Can specify agent and goal position, if not it set at random.
     """
 
+    # Goal offsets are drawn from the global numpy RNG
+    seeded_layouts = False
+
     def __init__(self, agent_pos=None, goal_pos=(17, 17), rem=9, doors=True, goal_rand_offset=0,
                  grid_size=19):
         rem = 9-rem
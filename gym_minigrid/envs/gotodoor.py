@@ -7,6 +7,8 @@ class GoToDoorEnv(MiniGridEnv):
     named using an English text string
     """
 
+    state_attrs = ['target_color', 'target_pos']
+
     def __init__(
         self,
         size=5
@@ -50,6 +50,9 @@ def get_room_neighbour(rix, x, y):
 
 
 class GridMaze(GridRooms):
+    # Mazes are drawn from the global random module
+    seeded_layouts = False
+
     def __init__(self,
                  grid_size=6,
                  goal_center_room=True,
@@ -107,7 +110,7 @@ class GridMaze(GridRooms):
                 dy, dx = room.door_pos[select_door]
                 if dx != ag_pos[0] or dy != ag_pos[1]:
                     # dx, dy = room.door_pos[select_door]
-                    self.grid.set(dx, dy, Wall())
+                    self.grid.set(dx, dy, Wall.shared())
                     room.door_pos[select_door] = None
 
 class GridMazeEGO(GridMaze):
@@ -131,53 +134,25 @@ class GridMazeEGO(GridMaze):
 
         return (topX, topY, botX, botY)
 
-    def gen_obs_grid(self):
-        """
-        Generate the sub-grid observed by the agent.
-        This method also outputs a visibility mask telling us which grid
-        cells the agent can actually see.
-        """
-
-        topX, topY, botX, botY = self.get_view_exts()
-
-        grid = self.grid.slice(topX, topY, self.agent_view_size, self.agent_view_size)
+    def get_view_rotations(self):
+        # The view is not rotated with the agent
+        return 0
 
-        # for i in range(self.agent_dir + 1):
-        #     grid = grid.rotate_left()
-
-        # Process occluders and visibility
-        # Note that this incurs some performance cost
-        if not self.see_through_walls:
-            vis_mask = grid.process_vis(agent_pos=(self.agent_view_size // 2,
-                                                   self.agent_view_size // 2))
-        else:
-            vis_mask = np.ones(shape=(grid.width, grid.height), dtype=np.bool)
-
-        # Make it so the agent sees what it's carrying
-        # We do this by placing the carried object at the agent's position
-        # in the agent's partially observable view
-        agent_pos = grid.width // 2, grid.height // 2
-        if self.carrying:
-            grid.set(*agent_pos, self.carrying)
-        else:
-            grid.set(*agent_pos, None)
-
-        return grid, vis_mask
+    def get_view_agent_pos(self):
+        return (self.agent_view_size // 2, self.agent_view_size // 2)
 
     def get_obs_render(self, obs, tile_size=TILE_PIXELS//2):
         """
         Render an agent observation for visualization
         """
 
-        grid, vis_mask = Grid.decode(obs)
-        vis_mask.fill(True)
-
-        # Render the whole grid
-        img = grid.render(
+        # Render the whole view, highlighting all of it
+        img = Grid.render_encoding(
+            obs,
             tile_size,
-            agent_pos=(self.agent_view_size // 2, self.agent_view_size // 2),
+            agent_pos=self.get_view_agent_pos(),
             agent_dir=3,
-            highlight_mask=vis_mask
+            highlight_mask=np.ones(shape=obs.shape[:2], dtype=bool)
         )
 
         return img
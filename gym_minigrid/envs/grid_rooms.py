@@ -7,6 +7,8 @@ from gym_minigrid.register import register
 
 
 class GridRooms(RoomGrid):
+    state_attrs = ['goal_crt_pos', '_intent_start_room']
+
     def __init__(self,
                  num_rows=3,
                  num_cols=3,
@@ -7,6 +7,8 @@ class LavaGapEnv(MiniGridEnv):
     This environment is similar to LavaCrossing but simpler in structure.
     """
 
+    state_attrs = ['gap_pos', 'goal_pos']
+
     def __init__(self, size, obstacle_type=Lava, seed=None):
         self.obstacle_type = obstacle_type
         super().__init__(
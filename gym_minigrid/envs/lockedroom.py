@@ -28,6 +28,8 @@ class LockedRoom(MiniGridEnv):
     named using an English text string
     """
 
+    state_attrs = ['rooms']
+
     def __init__(
         self,
         size=19
@@ -40,18 +42,18 @@ class LockedRoom(MiniGridEnv):
 
         # Generate the surrounding walls
         for i in range(0, width):
-            self.grid.set(i, 0, Wall())
-            self.grid.set(i, height-1, Wall())
+            self.grid.set(i, 0, Wall.shared())
+            self.grid.set(i, height-1, Wall.shared())
         for j in range(0, height):
-            self.grid.set(0, j, Wall())
-            self.grid.set(width-1, j, Wall())
+            self.grid.set(0, j, Wall.shared())
+            self.grid.set(width-1, j, Wall.shared())
 
         # Hallway walls
         lWallIdx = width // 2 - 2
         rWallIdx = width // 2 + 2
         for j in range(0, height):
-            self.grid.set(lWallIdx, j, Wall())
-            self.grid.set(rWallIdx, j, Wall())
+            self.grid.set(lWallIdx, j, Wall.shared())
+            self.grid.set(rWallIdx, j, Wall.shared())
 
         self.rooms = []
 
@@ -59,9 +61,9 @@ class LockedRoom(MiniGridEnv):
         for n in range(0, 3):
             j = n * (height // 3)
             for i in range(0, lWallIdx):
-                self.grid.set(i, j, Wall())
+                self.grid.set(i, j, Wall.shared())
             for i in range(rWallIdx, width):
-                self.grid.set(i, j, Wall())
+                self.grid.set(i, j, Wall.shared())
 
             roomW = lWallIdx + 1
             roomH = height // 3 + 1
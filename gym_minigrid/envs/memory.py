@@ -11,6 +11,8 @@ class MemoryEnv(MiniGridEnv):
     object at split.
     """
 
+    state_attrs = ['failure_pos', 'success_pos']
+
     def __init__(
         self,
         seed,
@@ -45,21 +47,21 @@ class MemoryEnv(MiniGridEnv):
 
         # Start room
         for i in range(1, 5):
-            self.grid.set(i, upper_room_wall, Wall())
-            self.grid.set(i, lower_room_wall, Wall())
-        self.grid.set(4, upper_room_wall + 1, Wall())
-        self.grid.set(4, lower_room_wall - 1, Wall())
+            self.grid.set(i, upper_room_wall, Wall.shared())
+            self.grid.set(i, lower_room_wall, Wall.shared())
+        self.grid.set(4, upper_room_wall + 1, Wall.shared())
+        self.grid.set(4, lower_room_wall - 1, Wall.shared())
 
         # Horizontal hallway
         for i in range(5, hallway_end):
-            self.grid.set(i, upper_room_wall + 1, Wall())
-            self.grid.set(i, lower_room_wall - 1, Wall())
+            self.grid.set(i, upper_room_wall + 1, Wall.shared())
+            self.grid.set(i, lower_room_wall - 1, Wall.shared())
 
         # Vertical hallway
         for j in range(0, height):
             if j != height // 2:
-                self.grid.set(hallway_end, j, Wall())
-            self.grid.set(hallway_end + 2, j, Wall())
+                self.grid.set(hallway_end, j, Wall.shared())
+            self.grid.set(hallway_end + 2, j, Wall.shared())
 
         # Fix the player's start position and orientation
         self.agent_pos = (self._rand_int(1, hallway_end + 1), height // 2)
@@ -14,6 +14,18 @@ class MultiObject(RoomGrid):
 
     """
 
+    # Object sequences are shuffled again between tasks
+    seeded_layouts = False
+
+    state_attrs = [
+        '_available_obj',
+        '_collected_obj',
+        '_crt_task',
+        '_crt_task_ids',
+        '_obj_ids',
+        '_obj_pos',
+    ]
+
     def __init__(self,
                  seed=None,
                  full_task=True,
@@ -136,14 +148,15 @@ class MultiObject(RoomGrid):
 
         st_i = task * task_size
         self._crt_task_ids = list(range(st_i, st_i + task_size))
+        self._obj_ids = {}
 
         for i in range(task_size):
             task_obj = objs[st_i + i]
             obj = task_obj[0](task_obj[1])
-            obj._obj_id = st_i + i
+            obj_id = self._obj_ids[obj] = st_i + i
             pos = self.place_obj(obj)
-            self._obj_pos[obj._obj_id] = pos
-            self._available_obj[obj._obj_id] = True
+            self._obj_pos[obj_id] = pos
+            self._available_obj[obj_id] = True
 
         self.place_agent()
 
@@ -224,7 +237,7 @@ class MultiObject(RoomGrid):
         info["full_task_achieved"] = False
 
         if self.carrying is not None:
-            obj_id = self.carrying._obj_id
+            obj_id = self._obj_ids[self.carrying]
             self._collected_obj.append(obj_id)
             # obs = self.gen_obs()
             obs["collected"] = obj_id
@@ -291,38 +304,8 @@ class MultiObjectEGO(MultiObject):
 
         return (topX, topY, botX, botY)
 
-    def gen_obs_grid(self):
-        """
-        Generate the sub-grid observed by the agent.
-        This method also outputs a visibility mask telling us which grid
-        cells the agent can actually see.
-        """
-
-        topX, topY, botX, botY = self.get_view_exts()
-
-        grid = self.grid.slice(topX, topY, self.agent_view_size, self.agent_view_size)
-
-        for i in range(self.agent_dir + 1):
-            grid = grid.rotate_left()
-
-        # Process occluders and visibility
-        # Note that this incurs some performance cost
-        if not self.see_through_walls:
-            vis_mask = grid.process_vis(agent_pos=(self.agent_view_size // 2 ,
-                                                   self.agent_view_size // 2))
-        else:
-            vis_mask = np.ones(shape=(grid.width, grid.height), dtype=np.bool)
-
-        # Make it so the agent sees what it's carrying
-        # We do this by placing the carried object at the agent's position
-        # in the agent's partially observable view
-        agent_pos = grid.width // 2, grid.height // 2
-        if self.carrying:
-            grid.set(*agent_pos, self.carrying)
-        else:
-            grid.set(*agent_pos, None)
-
-        return grid, vis_mask
+    def get_view_agent_pos(self):
+        return (self.agent_view_size // 2, self.agent_view_size // 2)
 
     def gen_obs(self):
         obs = super().gen_obs()
@@ -336,15 +319,13 @@ class MultiObjectEGO(MultiObject):
         Render an agent observation for visualization
         """
 
-        grid, vis_mask = Grid.decode(obs)
-        vis_mask.fill(True)
-
-        # Render the whole grid
-        img = grid.render(
+        # Render the whole view, highlighting all of it
+        img = Grid.render_encoding(
+            obs,
             tile_size,
-            agent_pos=(self.agent_view_size // 2, self.agent_view_size // 2),
+            agent_pos=self.get_view_agent_pos(),
             agent_dir=3,
-            highlight_mask=vis_mask
+            highlight_mask=np.ones(shape=obs.shape[:2], dtype=bool)
         )
 
         return img
@@ -359,31 +340,15 @@ class MultiObjectEGOOneHot(MultiObjectEGO):
         super().__init__(*args, **kwargs)
         obs_shape = self.observation_space['image'].shape
 
-        # Number of bits per cell
-        num_bits = len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + len(STATE_TO_IDX)
-
         self.observation_space.spaces["image"] = spaces.Box(
             low=0,
             high=255,
-            shape=(obs_shape[0], obs_shape[1], num_bits),
+            shape=(obs_shape[0], obs_shape[1], ONE_HOT_BITS),
             dtype='uint8'
         )
 
     def observation(self, obs):
-        img = obs['image']
-        out = np.zeros(self.observation_space.shape, dtype='uint8')
-
-        for i in range(img.shape[0]):
-            for j in range(img.shape[1]):
-                type = img[i, j, 0]
-                color = img[i, j, 1]
-                state = img[i, j, 2]
-
-                out[i, j, type] = 1
-                out[i, j, len(OBJECT_TO_IDX) + color] = 1
-                out[i, j, len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + state] = 1
-
-        obs["image"] = out
+        obs["image"] = one_hot_encode(obs['image'])
         return obs
 
 
@@ -407,7 +372,7 @@ class MultiObjectEGOtest(MultiObjectEGO):
         obs["collected"] = -1
 
         if self.carrying is not None:
-            obj_id = self.carrying._obj_id
+            obj_id = self._obj_ids[self.carrying]
 
             if obj_id == op:
                 self._collected_obj.append(obj_id)
@@ -18,6 +18,8 @@ class MultiRoomEnv(MiniGridEnv):
     Environment with multiple rooms (subgoals)
     """
 
+    state_attrs = ['goal_pos', 'rooms']
+
     def __init__(self,
         minNumRooms,
         maxNumRooms,
@@ -71,7 +73,7 @@ class MultiRoomEnv(MiniGridEnv):
 
         # Create the grid
         self.grid = Grid(width, height)
-        wall = Wall()
+        wall = Wall.shared()
 
         prevDoorColor = None
 
@@ -7,6 +7,11 @@ class PutNearEnv(MiniGridEnv):
     another object through a natural language string.
     """
 
+    state_attrs = [
+        'moveColor', 'move_pos', 'move_type',
+        'target_color', 'target_pos', 'target_type'
+    ]
+
     def __init__(
         self,
         size=6,
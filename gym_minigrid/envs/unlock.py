@@ -7,6 +7,8 @@ class Unlock(RoomGrid):
     Unlock a door
     """
 
+    state_attrs = ['door']
+
     def __init__(self, seed=None):
         room_size = 6
         super().__init__(
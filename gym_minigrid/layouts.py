@@ -0,0 +1,265 @@
+import multiprocessing
+from collections import deque, namedtuple
+from .minigrid import *
+from .lru import LRUCache
+from .minigrid import _copy_state, _state_attr_names
+
+# Environment after _gen_grid(), see capture_layout()
+Layout = namedtuple(
+    'Layout',
+    ['grid', 'agent_pos', 'agent_dir', 'mission', 'rng_state', 'extras']
+)
+
+def capture_layout(env):
+    """
+    Take a copy of the layout an environment was just generated with,
+    holding its own copies of the objects in the grid
+    """
+
+    memo = {}
+
+    return Layout(
+        env.grid.copy(memo),
+        _copy_state(env.agent_pos),
+        env.agent_dir,
+        env.mission,
+        env.np_random.get_state(),
+        tuple((name, _copy_state(getattr(env, name), memo)) for name in _state_attr_names(type(env)))
+    )
+
+def restore_layout(env, layout, copy=True):
+    """
+    Put an environment in the state it was right after generating a layout,
+    as if _gen_grid() had been called. The layout can be restored again,
+    unless `copy` is False and the environment takes its objects.
+    """
+
+    memo = {}
+
+    env.grid = layout.grid.copy(memo) if copy else layout.grid
+    env.agent_pos = _copy_state(layout.agent_pos)
+    env.agent_dir = layout.agent_dir
+    env.mission = layout.mission
+    env.np_random.set_state(layout.rng_state)
+
+    for name, value in layout.extras:
+        setattr(env, name, _copy_state(value, memo) if copy else value)
+
+def layout_key(env, seed):
+    """
+    Key identifying the layout an environment generates for a seed
+    """
+
+    return (type(env), repr(env._init_args), env.placement, seed)
+
+class LayoutCache(LRUCache):
+    """
+    Least recently used cache of the layouts generated by environments
+    right after being seeded, holding at most `capacity` layouts.
+
+    Once installed on environments, resetting them after seeding them
+    with a cached seed restores the cached layout instead of generating
+    it again. The cache can be shared by any number of environments, as
+    layouts are keyed by environment class, constructor arguments and
+    seed. Environments whose layouts depend on anything else must set
+    seeded_layouts to False.
+    """
+
+    def install(self, env):
+        """
+        Make an environment use this cache, returns the environment
+        """
+
+        env.unwrapped.layout_cache = self
+
+        return env
+
+    def restore(self, env, seed):
+        """
+        Restore the layout of an environment for a seed, returns
+        False if the layout is not in the cache
+        """
+
+        layout = self.get(layout_key(env, seed))
+
+        if layout is None:
+            return False
+
+        restore_layout(env, layout)
+
+        return True
+
+    def store(self, env, seed):
+        """
+        Add the layout an environment was just generated with for a seed,
+        evicting the least recently used layouts if the cache is full
+        """
+
+        self.put(layout_key(env, seed), capture_layout(env))
+
+def _pool_worker(remote, parent_remote, env_fn):
+    """
+    Generate the layouts of the seeds sent by a LayoutPool, as reset()
+    would right after seeding the environment
+    """
+
+    parent_remote.close()
+    env = env_fn().unwrapped
+
+    try:
+        while True:
+            seed = remote.recv()
+            env.seed(seed)
+            env.agent_pos = None
+            env.agent_dir = None
+            env._gen_grid(env.width, env.height)
+            remote.send((layout_key(env, seed), capture_layout(env)))
+    except Exception as e:
+        remote.send(e)
+    finally:
+        env.close()
+        remote.close()
+
+class LayoutPool:
+    """
+    Generates the layouts of upcoming episodes ahead of time in worker
+    processes, so that resetting does not wait for slow generators.
+
+    The pool follows a stream of seeds, keeping the layouts of the next
+    `size` seeds queued or being generated by `num_workers` processes,
+    each holding an environment made by `env_fn`. Once installed like a
+    LayoutCache, resetting an environment after seeding it with the next
+    seed of the stream restores the generated layout, waiting for it if
+    it isn't ready yet. Layouts are the same as the ones the environment
+    would generate itself. Seeds ahead of the stream skip the layouts of
+    the seeds before them, other seeds are generated by the environment.
+    """
+
+    def __init__(self, env_fn, seeds, num_workers=1, size=8, context=None):
+        assert num_workers > 0 and size > 0
+        self.size = size
+        self.seeds = iter(seeds)
+        self.pending = deque()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.closed = False
+
+        # The workers answer through pipes rather than a multiprocessing
+        # pool, whose result threads would compete with the environment
+        ctx = multiprocessing.get_context(context)
+        self._remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(num_workers)])
+        self._processes = []
+        self._next_remote = 0
+
+        for work_remote, remote in zip(work_remotes, self._remotes):
+            process = ctx.Process(
+                target=_pool_worker,
+                args=(work_remote, remote, env_fn),
+                daemon=True
+            )
+            process.start()
+            work_remote.close()
+            self._processes.append(process)
+
+        self._fill()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _fill(self):
+        """
+        Send the next seeds of the stream to the workers, in turn
+        """
+
+        while len(self.pending) < self.size:
+            seed = next(self.seeds, None)
+            if seed is None:
+                break
+
+            remote = self._remotes[self._next_remote]
+            self._next_remote = (self._next_remote + 1) % len(self._remotes)
+            remote.send(seed)
+            self.pending.append((seed, remote))
+
+    def _recv(self):
+        # Each worker answers in the order it received the seeds
+        _, remote = self.pending.popleft()
+        result = remote.recv()
+
+        if isinstance(result, Exception):
+            raise result
+
+        return result
+
+    def install(self, env):
+        """
+        Make an environment use this pool, returns the environment
+        """
+
+        env.unwrapped.layout_cache = self
+
+        return env
+
+    def restore(self, env, seed):
+        """
+        Restore the layout of an environment for the next seed of the
+        stream, returns False if the seed isn't one of the upcoming ones
+        """
+
+        if self.closed or all(s != seed for s, _ in self.pending):
+            self.misses += 1
+            return False
+
+        while self.pending[0][0] != seed:
+            self._recv()
+            self.skipped += 1
+
+        key, layout = self._recv()
+        self._fill()
+
+        # The worker environments must match the installed environments
+        if key != layout_key(env, seed):
+            self.misses += 1
+            return False
+
+        # Received layouts are only restored once
+        self.hits += 1
+        restore_layout(env, layout, copy=False)
+
+        return True
+
+    def store(self, env, seed):
+        # Layouts generated by the environments aren't kept
+        pass
+
+    def stats(self):
+        """
+        Get the counters of the pool
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'pending': len(self.pending),
+            'size': self.size,
+        }
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        # Workers may be blocked sending layouts nobody will receive
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        for remote in self._remotes:
+            remote.close()
+        self.pending.clear()
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
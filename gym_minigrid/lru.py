@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Least recently used cache holding at most `capacity` entries, which
+    counts its hits, misses and evictions. Subclasses can keep track of
+    the entries coming and going by overriding _added() and _removed().
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def _added(self, value):
+        pass
+
+    def _removed(self, value):
+        pass
+
+    def get(self, key):
+        """
+        Get a cached entry, or None if it's not in the cache
+        """
+
+        value = self.entries.get(key)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key, value):
+        """
+        Add an entry to the cache, evicting the least recently used
+        entries if the cache is full
+        """
+
+        if key in self.entries:
+            self._removed(self.entries.pop(key))
+
+        self.entries[key] = value
+        self._added(value)
+
+        self.resize(self.capacity)
+
+    def resize(self, capacity):
+        """
+        Change the capacity of the cache
+        """
+
+        self.capacity = capacity
+
+        while len(self.entries) > self.capacity:
+            _, value = self.entries.popitem(last=False)
+            self._removed(value)
+            self.evictions += 1
+
+    def clear(self):
+        for value in self.entries.values():
+            self._removed(value)
+        self.entries.clear()
+
+    def stats(self):
+        """
+        Get the counters of the cache
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'capacity': self.capacity,
+        }
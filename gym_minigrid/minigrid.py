@@ -1,6 +1,8 @@
+import copy
 import math
 import gym
 from enum import IntEnum
+from collections import namedtuple
 import numpy as np
 from gym import error, spaces, utils
 from gym.utils import seeding
@@ -49,7 +51,9 @@ OBJECT_TO_IDX = {
     'fake_goal'         : 8,
 }
 
-IDX_TO_OBJECT = dict(zip(OBJECT_TO_IDX.values(), OBJECT_TO_IDX.keys()))
+# Aliases such as 'fake_goal' share the index of the type they imitate,
+# the first name registered for an index is the one used when decoding
+IDX_TO_OBJECT = {v: k for k, v in reversed(list(OBJECT_TO_IDX.items()))}
 
 # Map of state names to integers
 STATE_TO_IDX = {
@@ -58,6 +62,12 @@ STATE_TO_IDX = {
     'locked': 2,
 }
 
+# Encoding of an empty cell
+EMPTY_ENCODING = (OBJECT_TO_IDX['empty'], 0, 0)
+
+# Encoding of the walls placed outside of the grid in agent views
+WALL_ENCODING = (OBJECT_TO_IDX['wall'], COLOR_TO_IDX['grey'], 0)
+
 # Map of agent direction indices to vectors
 DIR_TO_VEC = [
     # Pointing right (positive X)
@@ -70,11 +80,49 @@ DIR_TO_VEC = [
     np.array((0, -1)),
 ]
 
+# Names of the slots of WorldObj classes, indexed by class
+_slots = {}
+
+def _slot_names(cls):
+    names = _slots.get(cls)
+    if names is None:
+        names = _slots[cls] = [
+            name for c in cls.__mro__ for name in c.__dict__.get('__slots__', ())
+        ]
+    return names
+
 class WorldObj:
     """
-    Base class for grid world objects
+    Base class for grid world objects.
+
+    Grids keep the encoding of their cells, objects are encoded when they
+    are set in a grid. The grid re-encodes the objects whose class has
+    mutable_encoding set before its encoding is read, which is the default
+    for subclasses defined outside this module. Subclasses whose encoding
+    never changes while in a grid can set it to False.
     """
 
+    __slots__ = ('type', 'color', 'contains', 'init_pos', 'cur_pos')
+
+    # Whether the encoding of this object can change while it is in a grid
+    # (e.g. a door being opened). The grid re-encodes these objects before
+    # its planes are read, other objects are encoded once when set.
+    mutable_encoding = True
+
+    # Whether objects of this type never change once they are in a grid,
+    # in which case copies of the grid share them instead of duplicating them
+    immutable = False
+
+    # Shared instances of immutable objects, see shared()
+    _shared = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Objects are re-encoded unless their class says otherwise
+        if 'mutable_encoding' not in cls.__dict__:
+            cls.mutable_encoding = True
+
     def __init__(self, type, color):
         assert type in OBJECT_TO_IDX, type
         assert color in COLOR_TO_IDX, color
@@ -88,6 +136,51 @@ class WorldObj:
         # Current position of the object
         self.cur_pos = None
 
+    @classmethod
+    def shared(cls, *args):
+        """
+        Get an instance of an immutable object which is shared with all
+        the grids using it, instead of creating a new one. Shared instances
+        must not be placed with place_obj() or put_obj(), which set their
+        position.
+        """
+
+        assert cls.immutable
+
+        key = (cls,) + args
+        v = WorldObj._shared.get(key)
+        if v is None:
+            v = WorldObj._shared[key] = cls(*args)
+
+        return v
+
+    def copy(self, memo=None):
+        """
+        Copy this object along with the object it contains. The optional
+        memo dict maps the ids of objects to their copies, so that objects
+        reached several times are only copied once, as with deepcopy().
+        The attributes of subclasses without __slots__ are deep copied.
+        """
+
+        if memo is None:
+            memo = {}
+
+        c = memo.get(id(self))
+        if c is None:
+            cls = type(self)
+            c = memo[id(self)] = cls.__new__(cls)
+            for name in _slot_names(cls):
+                setattr(c, name, getattr(self, name))
+            if c.contains is not None:
+                c.contains = c.contains.copy(memo)
+            if hasattr(self, '__dict__'):
+                c.__dict__.update(copy.deepcopy(self.__dict__, memo))
+
+        return c
+
+    def __deepcopy__(self, memo):
+        return self if self.immutable else self.copy(memo)
+
     def can_overlap(self):
         """Can the agent overlap with this?"""
         return False
@@ -112,6 +205,14 @@ class WorldObj:
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
 
+    def get_state(self):
+        """Get the attributes of this object that can change during an episode"""
+        return (self.cur_pos,)
+
+    def set_state(self, state):
+        """Restore attributes saved by get_state()"""
+        self.cur_pos, = state
+
     @staticmethod
     def decode(type_idx, color_idx, state):
         """Create an object from a 3-tuple state description"""
@@ -127,9 +228,9 @@ class WorldObj:
         is_locked = state == 2
 
         if obj_type == 'wall':
-            v = Wall(color)
+            v = Wall.shared(color)
         elif obj_type == 'floor':
-            v = Floor(color)
+            v = Floor.shared(color)
         elif obj_type == 'ball':
             v = Ball(color)
         elif obj_type == 'key':
@@ -139,11 +240,11 @@ class WorldObj:
         elif obj_type == 'door':
             v = Door(color, is_open, is_locked)
         elif obj_type == 'goal':
-            v = Goal()
+            v = Goal.shared()
         elif obj_type == 'lava':
-            v = Lava()
+            v = Lava.shared()
         else:
-            assert False, "unknown object type in decode '%s'" % objType
+            assert False, "unknown object type in decode '%s'" % obj_type
 
         return v
 
@@ -152,6 +253,11 @@ class WorldObj:
         raise NotImplementedError
 
 class Goal(WorldObj):
+    __slots__ = ()
+
+    immutable = True
+    mutable_encoding = False
+
     def __init__(self):
         super().__init__('goal', 'green')
 
@@ -166,25 +272,28 @@ class Floor(WorldObj):
     Colored floor tile the agent can walk over
     """
 
+    __slots__ = ()
+
+    immutable = True
+    mutable_encoding = False
+
     def __init__(self, color='blue'):
         super().__init__('floor', color)
 
     def can_overlap(self):
         return True
 
-    def render(self, r):
+    def render(self, img):
         # Give the floor a pale color
-        c = COLORS[self.color]
-        r.setLineColor(100, 100, 100, 0)
-        r.setColor(*c/2)
-        r.drawPolygon([
-            (1          , TILE_PIXELS),
-            (TILE_PIXELS, TILE_PIXELS),
-            (TILE_PIXELS,           1),
-            (1          ,           1)
-        ])
+        color = COLORS[self.color] / 2
+        fill_coords(img, point_in_rect(0.031, 1, 0.031, 1), color)
 
 class Lava(WorldObj):
+    __slots__ = ()
+
+    immutable = True
+    mutable_encoding = False
+
     def __init__(self, color='red'):
         super().__init__('lava', color)
 
@@ -207,6 +316,11 @@ class Lava(WorldObj):
             fill_coords(img, point_in_line(0.7, yhi, 0.9, ylo, r=0.03), (0,0,0))
 
 class Wall(WorldObj):
+    __slots__ = ()
+
+    immutable = True
+    mutable_encoding = False
+
     def __init__(self, color='grey'):
         super().__init__('wall', color)
 
@@ -217,6 +331,10 @@ class Wall(WorldObj):
         fill_coords(img, point_in_rect(0, 1, 0, 1), COLORS[self.color])
 
 class Door(WorldObj):
+    __slots__ = ('is_open', 'is_locked')
+
+    mutable_encoding = True
+
     def __init__(self, color, is_open=False, is_locked=False):
         super().__init__('door', color)
         self.is_open = is_open
@@ -254,6 +372,12 @@ class Door(WorldObj):
 
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], state)
 
+    def get_state(self):
+        return (self.cur_pos, self.is_open, self.is_locked)
+
+    def set_state(self, state):
+        self.cur_pos, self.is_open, self.is_locked = state
+
     def render(self, img):
         c = COLORS[self.color]
 
@@ -279,6 +403,10 @@ class Door(WorldObj):
             fill_coords(img, point_in_circle(cx=0.75, cy=0.50, r=0.08), c)
 
 class Key(WorldObj):
+    __slots__ = ()
+
+    mutable_encoding = False
+
     def __init__(self, color='blue'):
         super(Key, self).__init__('key', color)
 
@@ -300,6 +428,10 @@ class Key(WorldObj):
         fill_coords(img, point_in_circle(cx=0.56, cy=0.28, r=0.064), (0,0,0))
 
 class Ball(WorldObj):
+    __slots__ = ()
+
+    mutable_encoding = False
+
     def __init__(self, color='blue'):
         super(Ball, self).__init__('ball', color)
 
@@ -310,6 +442,10 @@ class Ball(WorldObj):
         fill_coords(img, point_in_circle(0.5, 0.5, 0.31), COLORS[self.color])
 
 class Box(WorldObj):
+    __slots__ = ()
+
+    mutable_encoding = False
+
     def __init__(self, color, contains=None):
         super(Box, self).__init__('box', color)
         self.contains = contains
@@ -332,13 +468,241 @@ class Box(WorldObj):
         env.grid.set(*pos, self.contains)
         return True
 
+def _object_table(prop, empty=False):
+    """
+    Tabulate a boolean property of the objects matching each encoded
+    (type, state) pair, cells with no object get the value of `empty`
+    """
+
+    table = np.zeros((max(IDX_TO_OBJECT) + 1, len(STATE_TO_IDX)), dtype=bool)
+    table[OBJECT_TO_IDX['empty']] = empty
+
+    for type_idx, obj_type in IDX_TO_OBJECT.items():
+        if obj_type in ['unseen', 'empty', 'agent']:
+            continue
+        for state in STATE_TO_IDX.values():
+            v = WorldObj.decode(type_idx, 0, state)
+            table[type_idx, state] = prop(v)
+
+    return table
+
+# Properties of encoded cells, indexed by type and state
+OPAQUE = _object_table(lambda v: not v.see_behind())
+CAN_OVERLAP = _object_table(lambda v: v.can_overlap(), empty=True)
+CAN_PICKUP = _object_table(lambda v: v.can_pickup())
+
+# Bits of the one-hot encoding of a cell, for its type, color and state
+ONE_HOT_BITS = len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + len(STATE_TO_IDX)
+
+# Flat code of a cell encoding, the index of its row in one-hot tables
+ONE_HOT_STRIDES = np.array(
+    [len(COLOR_TO_IDX) * len(STATE_TO_IDX), len(STATE_TO_IDX), 1],
+    dtype=np.uint16
+)
+
+# One-hot tables, indexed by dtype and packing
+_one_hot_tables = {}
+
+def one_hot_table(dtype='uint8', packed=False):
+    """
+    Get the one-hot encodings of all the cell encodings, indexed by flat
+    code. The rows of packed tables hold the bits packed into bytes, in
+    the order of np.packbits().
+    """
+
+    key = (np.dtype(dtype), packed)
+    table = _one_hot_tables.get(key)
+
+    if table is None:
+        shape = (max(IDX_TO_OBJECT) + 1, len(COLOR_TO_IDX), len(STATE_TO_IDX))
+        fields = np.indices(shape).reshape(3, -1)
+        rows = np.arange(fields.shape[1])
+        offsets = [0, len(OBJECT_TO_IDX), len(OBJECT_TO_IDX) + len(COLOR_TO_IDX)]
+
+        bits = np.zeros((len(rows), ONE_HOT_BITS), dtype=bool)
+        for field, offset in zip(fields, offsets):
+            bits[rows, offset + field] = True
+
+        table = np.packbits(bits, axis=-1) if packed else bits.astype(dtype)
+        _one_hot_tables[key] = table
+
+    return table
+
+def one_hot_encode(image, out=None, dtype='uint8', packed=False):
+    """
+    One-hot encode the type, color and state of each cell of an encoded
+    grid or agent view with a single table lookup, the result has one
+    more dimension of ONE_HOT_BITS bits, or of their packed bytes
+    """
+
+    codes = image.dot(ONE_HOT_STRIDES)
+
+    return np.take(one_hot_table(dtype, packed), codes, axis=0, out=out)
+
+# Zobrist keys of the cell encodings, indexed by number of cells
+_zobrist_tables = {}
+
+def zobrist_table(num_cells):
+    """
+    Get the random 64-bit keys of every encoding of each cell of a grid,
+    indexed by cell, type, color and state. The keys of empty cells are
+    zero, so that the hash of an empty grid is zero. Tables are generated
+    from a fixed seed, hashes are the same in all processes.
+    """
+
+    table = _zobrist_tables.get(num_cells)
+
+    if table is None:
+        shape = (num_cells, max(IDX_TO_OBJECT) + 1, len(COLOR_TO_IDX), len(STATE_TO_IDX))
+        rng = np.random.RandomState(num_cells)
+        table = np.frombuffer(rng.bytes(8 * np.prod(shape)), dtype=np.uint64)
+        table = table.reshape(shape).copy()
+        table[(slice(None),) + EMPTY_ENCODING] = 0
+        _zobrist_tables[num_cells] = table
+
+    return table
+
+# Zobrist keys of the agent, indexed by number of cells
+_agent_zobrist_tables = {}
+
+def agent_zobrist_table(num_cells):
+    """
+    Get the random 64-bit keys of the agent in each cell of a grid facing
+    each direction, indexed by cell and direction, along with the keys of
+    the encodings of the carried object, indexed by type, color and state.
+    Like zobrist_table(), the keys are the same in all processes.
+    """
+
+    tables = _agent_zobrist_tables.get(num_cells)
+
+    if tables is None:
+        shapes = [
+            (num_cells, 4),
+            (max(IDX_TO_OBJECT) + 1, len(COLOR_TO_IDX), len(STATE_TO_IDX))
+        ]
+        rng = np.random.RandomState([num_cells, 1])
+        tables = _agent_zobrist_tables[num_cells] = tuple(
+            np.frombuffer(rng.bytes(8 * np.prod(shape)), dtype=np.uint64).reshape(shape)
+            for shape in shapes
+        )
+
+    return tables
+
+# Per view width tables used by vis_mask_from_opacity()
+_vis_tables = {}
+
+def vis_mask_from_opacity(opaque, agent_pos):
+    """
+    Compute which cells of a view are visible from the agent position,
+    given a (width, height) mask of the cells that block the view. This
+    gives the same result as Grid.process_vis(), but each row of the view
+    is propagated at once, as an integer bitset.
+    """
+
+    width, height = opaque.shape
+
+    if width not in _vis_tables:
+        # Views wider than 62 cells don't fit in int64 bitsets
+        dtype = np.int64 if width < 63 else object
+        powers = np.array([1 << i for i in range(width)], dtype=dtype)
+        shifts = np.arange(width)[:, np.newaxis]
+
+        # Bit reversal of all rows, for views that are small enough
+        fmt = '0%db' % width
+        if width <= 16:
+            reverse = [int(format(x, fmt)[::-1], 2) for x in range(1 << width)]
+        else:
+            reverse = None
+
+        _vis_tables[width] = (dtype, powers, shifts, reverse, fmt)
+
+    dtype, powers, shifts, reverse, fmt = _vis_tables[width]
+
+    # Bitsets of the cells each row lets the view through
+    clear_rows = powers.dot(~opaque).tolist()
+
+    full = (1 << width) - 1
+    inner = full >> 1
+
+    rows = [0] * height
+    mask = 0
+
+    # The view propagates from the agent row towards the top of the view
+    for j in range(agent_pos[1], -1, -1):
+        if j == agent_pos[1]:
+            mask |= 1 << int(agent_pos[0])
+        elif mask == 0:
+            break
+
+        # Propagate right through clear cells: adding the seeds to the
+        # clear cells carries through each run up to the next blocker
+        clear = clear_rows[j]
+        seeds = mask & clear
+        mask = (mask | ((clear + seeds) ^ clear) | seeds) & full
+        seen = mask & clear & inner
+        above = seen | (seen << 1)
+
+        # Propagate left in the same way on the bit-reversed row
+        if reverse is not None:
+            clear = reverse[clear]
+            mask = reverse[mask]
+        else:
+            clear = int(format(clear, fmt)[::-1], 2)
+            mask = int(format(mask, fmt)[::-1], 2)
+        seeds = mask & clear
+        mask = (mask | ((clear + seeds) ^ clear) | seeds) & full
+        seen = mask & clear & inner
+        seen = (seen | (seen << 1)) & full
+        if reverse is not None:
+            above |= reverse[seen]
+            rows[j] = reverse[mask]
+        else:
+            above |= int(format(seen, fmt)[::-1], 2)
+            rows[j] = int(format(mask, fmt)[::-1], 2)
+
+        mask = above & full
+
+    return (np.array(rows, dtype=dtype) >> shifts) & 1 == 1
+
+def compute_vis_mask(image, agent_pos):
+    """
+    Compute which cells of an encoded agent view are visible from the
+    agent position, following the same rules as Grid.process_vis()
+    """
+
+    return vis_mask_from_opacity(OPAQUE[image[:, :, 0], image[:, :, 2]], agent_pos)
+
+def _agent_inside(planes, agent_pos):
+    """
+    Check if the agent is within the bounds of a grid encoding
+    """
+
+    return (
+        agent_pos is not None and
+        0 <= agent_pos[0] < planes.shape[0] and
+        0 <= agent_pos[1] < planes.shape[1]
+    )
+
+# Snapshot of a grid, see Grid.get_state()
+GridState = namedtuple(
+    'GridState',
+    ['width', 'height', 'codes', 'hash', 'objects', 'mutable', 'shareable', 'obj_states']
+)
+
 class Grid:
     """
     Represent a grid and operations on it
     """
 
-    # Static cache of pre-renderer tiles
-    tile_cache = {}
+    # Static cache of rendered tiles, which also holds the tiles of lazy atlases
+    tile_cache = TileCache(capacity=1024)
+
+    # Prebuilt tile atlases, indexed by tile size and subdivisions
+    tile_atlases = {}
+
+    # Static cache of the cell offsets gathered by encode_slice(),
+    # indexed by view size and number of rotations
+    slice_offsets = {}
 
     def __init__(self, width, height):
         assert width >= 3
@@ -349,6 +713,29 @@ class Grid:
 
         self.grid = [None] * width * height
 
+        # Type, color and state planes holding the encoding of every cell.
+        # These are kept in sync by set(), the object list above is only
+        # needed to hand back the WorldObj instances stored in the grid.
+        # Cells are stored column by column (index i * height + j) so that
+        # they reshape into the (width, height, 3) layout of encode(). The
+        # extra last row encodes the wall assumed around the grid.
+        self._codes = np.zeros((width * height + 1, 3), dtype=np.uint8)
+        self._codes[:-1, 0] = OBJECT_TO_IDX['empty']
+        self._codes[-1] = WALL_ENCODING
+
+        # Objects with a mutable encoding, indexed by position
+        self._mutable = {}
+
+        # Whether the object of each cell, stored as in the planes, never
+        # changes and can be shared by copies of the grid
+        self._shareable = np.ones(width * height, dtype=bool)
+
+        # Zobrist hash of the encoding, updated along with it
+        self._hash = 0
+
+        # Number of changes made to the encoding
+        self._version = 0
+
     def __contains__(self, key):
         if isinstance(key, WorldObj):
             for e in self.grid:
@@ -365,38 +752,212 @@ class Grid:
         return False
 
     def __eq__(self, other):
-        grid1  = self.encode()
-        grid2 = other.encode()
-        return np.array_equal(grid2, grid1)
+        # Grids with different hashes can't be equal
+        if self.hash != other.hash:
+            return False
+        return np.array_equal(self.planes, other.planes)
 
     def __ne__(self, other):
         return not self == other
 
-    def copy(self):
-        from copy import deepcopy
-        return deepcopy(self)
+    def copy(self, memo=None):
+        """
+        Copy the grid. Objects which never change, such as walls, are
+        shared with the copy, only the other objects are duplicated. The
+        optional memo dict is filled with the copies of the objects, see
+        WorldObj.copy().
+        """
+
+        if memo is None:
+            memo = {}
+
+        self._sync()
+
+        grid = Grid.__new__(Grid)
+        grid.width = self.width
+        grid.height = self.height
+        grid.grid = list(self.grid)
+        grid._codes = self._codes.copy()
+        grid._mutable = {}
+        grid._shareable = self._shareable.copy()
+        grid._hash = self._hash
+        grid._version = self._version
+
+        for k in np.flatnonzero(~self._shareable).tolist():
+            i, j = divmod(k, self.height)
+            c = grid.grid[j * self.width + i].copy(memo)
+            grid.grid[j * self.width + i] = c
+            if c.mutable_encoding:
+                grid._mutable[i, j] = c
+
+        return grid
+
+    def get_state(self):
+        """
+        Snapshot the contents of the grid. The snapshot refers to the
+        objects in the grid rather than copying them, along with the
+        attributes of these objects that can change, so that restoring it
+        keeps the identity of objects other code holds on to.
+        """
+
+        self._sync()
+        codes = self._codes.copy()
+        codes.flags.writeable = False
+
+        # Walls never change, only the state of other objects is saved
+        types = codes[:-1, 0]
+        cells = np.flatnonzero(
+            (types != OBJECT_TO_IDX['empty']) & (types != OBJECT_TO_IDX['wall'])
+        )
+        objects = tuple(self.grid)
+        obj_states = tuple(
+            (v, v.get_state()) for v in
+            (objects[(k % self.height) * self.width + k // self.height] for k in cells.tolist())
+        )
+
+        return GridState(
+            self.width,
+            self.height,
+            codes,
+            self._hash,
+            objects,
+            tuple(self._mutable.items()),
+            self._shareable.copy(),
+            obj_states
+        )
+
+    def set_state(self, state):
+        """
+        Restore the grid in place to a snapshot taken by get_state()
+        """
+
+        assert (state.width, state.height) == (self.width, self.height)
+
+        self._codes[:] = state.codes
+        self._hash = state.hash
+        self._version += 1
+        self.grid[:] = state.objects
+        self._mutable = dict(state.mutable)
+        self._shareable[:] = state.shareable
+
+        for v, obj_state in state.obj_states:
+            v.set_state(obj_state)
 
     def set(self, i, j, v):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
         self.grid[j * self.width + i] = v
 
+        if v is None:
+            self._write(i * self.height + j, EMPTY_ENCODING)
+            self._shareable[i * self.height + j] = True
+            self._mutable.pop((i, j), None)
+        else:
+            self._write(i * self.height + j, v.encode())
+            self._shareable[i * self.height + j] = v.immutable and not v.mutable_encoding
+            if v.mutable_encoding:
+                self._mutable[i, j] = v
+            else:
+                self._mutable.pop((i, j), None)
+
     def get(self, i, j):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
         return self.grid[j * self.width + i]
 
+    def empty_cells(self, top, size):
+        """
+        Get the positions of the empty cells within a rectangle of the grid,
+        as a (num_cells, 2) array listing the cells column by column
+        """
+
+        x0, y0 = max(top[0], 0), max(top[1], 0)
+        x1 = min(top[0] + size[0], self.width)
+        y1 = min(top[1] + size[1], self.height)
+
+        # The types of cells are always up to date, only states can change
+        types = self._codes[:-1, 0].reshape(self.width, self.height)
+        i, j = np.nonzero(types[x0:x1, y0:y1] == OBJECT_TO_IDX['empty'])
+
+        return np.stack([i + x0, j + y0], axis=1)
+
+    def _write(self, k, enc):
+        """
+        Write the encoding of the cell at index k of the storage,
+        updating the hash of the grid
+        """
+
+        table = zobrist_table(len(self.grid))
+        self._hash ^= table.item(k, *self._codes[k].tolist()) ^ table.item(k, *enc)
+        self._codes[k] = enc
+        self._version += 1
+
+    def _sync(self):
+        """
+        Re-encode the objects whose encoding may have changed in place
+        """
+
+        codes = self._codes
+        for (i, j), v in self._mutable.items():
+            k = i * self.height + j
+            enc = v.encode()
+            if tuple(codes[k].tolist()) != enc:
+                self._write(k, enc)
+
+    @property
+    def hash(self):
+        """
+        64-bit Zobrist hash of the grid encoding, maintained as cells are
+        set. Equal grids have equal hashes.
+        """
+
+        self._sync()
+        return self._hash
+
+    @property
+    def version(self):
+        """
+        Counter of the changes made to the grid encoding, which is the same
+        as long as the planes are, e.g. to keep copies of them up to date
+        """
+
+        self._sync()
+        return self._version
+
+    @property
+    def planes(self):
+        """
+        Live (width, height, 3) uint8 array holding the type, color and
+        state planes of the grid. This is the grid's own storage and must
+        not be written to, use set() instead.
+        """
+
+        self._sync()
+        return self._codes[:-1].reshape(self.width, self.height, 3)
+
+    @property
+    def type_plane(self):
+        return self.planes[:, :, 0]
+
+    @property
+    def color_plane(self):
+        return self.planes[:, :, 1]
+
+    @property
+    def state_plane(self):
+        return self.planes[:, :, 2]
+
     def horz_wall(self, x, y, length=None, obj_type=Wall):
         if length is None:
             length = self.width - x
         for i in range(0, length):
-            self.set(x + i, y, obj_type())
+            self.set(x + i, y, obj_type.shared() if obj_type.immutable else obj_type())
 
     def vert_wall(self, x, y, length=None, obj_type=Wall):
         if length is None:
             length = self.height - y
         for j in range(0, length):
-            self.set(x, y + j, obj_type())
+            self.set(x, y + j, obj_type.shared() if obj_type.immutable else obj_type())
 
     def wall_rect(self, x, y, w, h):
         self.horz_wall(x, y, w)
@@ -434,12 +995,56 @@ class Grid:
                    y >= 0 and y < self.height:
                     v = self.get(x, y)
                 else:
-                    v = Wall()
+                    v = Wall.shared()
 
                 grid.set(i, j, v)
 
         return grid
 
+    @staticmethod
+    def view_offsets(size, rotations=0):
+        """
+        Get the (x, y) offsets, relative to the top-left corner of a square
+        subset of the grid, of the cells in each position of that subset
+        once rotated left (counter-clockwise) a given number of times
+        """
+
+        key = (size, rotations % 4)
+        if key not in Grid.slice_offsets:
+            # Rotating an array indexed by (x, y) to the left is a
+            # clockwise rotation of its numpy representation
+            xs, ys = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+            Grid.slice_offsets[key] = (
+                np.rot90(xs, -key[1]).copy(),
+                np.rot90(ys, -key[1]).copy()
+            )
+
+        return Grid.slice_offsets[key]
+
+    def encode_slice(self, topX, topY, size, rotations=0, out=None):
+        """
+        Encode a square subset of the grid, rotated left (counter-clockwise)
+        a given number of times. This gives the same array as encoding the
+        output of slice() after calling rotate_left() on it, but gathers
+        the cells straight from the grid planes. Cells outside of the grid
+        are encoded as walls.
+        """
+
+        dx, dy = Grid.view_offsets(size, rotations)
+
+        xs = dx + topX
+        ys = dy + topY
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        idx = np.where(inside, xs * self.height + ys, self.width * self.height)
+
+        if out is None:
+            out = np.empty((size, size, 3), dtype=np.uint8)
+
+        self._sync()
+        np.take(self._codes, idx, axis=0, out=out)
+
+        return out
+
     @classmethod
     def render_tile(
         cls,
@@ -454,12 +1059,47 @@ class Grid:
         Render a tile and cache the result
         """
 
-        # Hash map lookup key for the cache
-        key = (agent_dir, highlight, tile_size, carrying)
-        key = obj.encode() + key if obj else key
+        # Use the prebuilt tile atlas for this size if there is one
+        atlas = cls.tile_atlases.get((tile_size, subdivs))
+        if atlas is not None:
+            img = atlas.get(obj, agent_dir, carrying, highlight)
+            if img is not None:
+                return img
+
+        # Hash map lookup key for the cache, made of encodings only so that
+        # equivalent objects share their tiles
+        key = (
+            obj.encode() if obj else None,
+            agent_dir,
+            bool(highlight),
+            tile_size,
+            subdivs,
+            carrying.encode() if carrying else None
+        )
+
+        img = cls.tile_cache.get(key)
+        if img is not None:
+            return img
 
-        if key in cls.tile_cache:
-            return cls.tile_cache[key]
+        img = cls.rasterize_tile(obj, agent_dir, carrying, highlight, tile_size, subdivs)
+
+        # Cache the rendered tile
+        cls.tile_cache.put(key, img)
+
+        return img
+
+    @staticmethod
+    def rasterize_tile(
+        obj,
+        agent_dir=None,
+        carrying=None,
+        highlight=False,
+        tile_size=TILE_PIXELS,
+        subdivs=3
+    ):
+        """
+        Render a tile, without caching
+        """
 
         img = np.zeros(shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8)
 
@@ -492,56 +1132,293 @@ class Grid:
         # Downsample the image to perform supersampling/anti-aliasing
         img = downsample(img, subdivs)
 
-        # Cache the rendered tile
-        cls.tile_cache[key] = img
-
         return img
 
-    def render(
-        self,
-        tile_size,
+    @classmethod
+    def get_tile_atlas(cls, tile_size, subdivs=3):
+        """
+        Get the tile atlas installed for a tile size, or install a lazily
+        rasterized one if there is none
+        """
+
+        atlas = cls.tile_atlases.get((tile_size, subdivs))
+
+        if atlas is None:
+            from .tiles import TileAtlas
+            atlas = TileAtlas.lazy(tile_size, subdivs).install()
+
+        return atlas
+
+    @staticmethod
+    def tile_rows(
+        planes,
+        atlas,
         agent_pos=None,
         agent_dir=None,
         carrying=None,
         highlight_mask=None
     ):
         """
-        Render this grid at a given scale
-        :param r: target renderer object
-        :param tile_size: tile size in pixels
+        Find the row of a tile atlas holding the tile of each cell of a
+        grid encoding, or -1 for the cells whose tile is not in the atlas
         """
 
+        width, height, _ = planes.shape
+
         if highlight_mask is None:
-            highlight_mask = np.zeros(shape=(self.width, self.height), dtype=np.bool)
+            highlight_mask = np.zeros(shape=(width, height), dtype=bool)
+
+        rows = atlas.index[
+            planes[:, :, 0],
+            planes[:, :, 1],
+            planes[:, :, 2],
+            0,
+            highlight_mask.astype(np.uint8),
+            0,
+            0
+        ]
+
+        if _agent_inside(planes, agent_pos):
+            i, j = agent_pos
+            rows[i, j] = atlas.lookup(
+                planes[i, j],
+                agent_dir,
+                highlight_mask[i, j],
+                carrying.encode() if carrying else None
+            )
+
+        return rows
+
+    @staticmethod
+    def blit_tiles(
+        out,
+        planes,
+        atlas,
+        rows,
+        agent_pos=None,
+        agent_dir=None,
+        carrying=None,
+        highlight_mask=None,
+        dirty=None
+    ):
+        """
+        Copy the tiles given by tile_rows() into a frame. If a mask of
+        dirty cells is given, only the tiles of these cells are copied.
+        """
 
-        # Compute the total grid size
-        width_px = self.width * tile_size
-        height_px = self.height * tile_size
+        width, height, _ = planes.shape
+        tile_size = atlas.tile_size
+
+        if highlight_mask is None:
+            highlight_mask = np.zeros(shape=(width, height), dtype=bool)
 
-        img = np.zeros(shape=(height_px, width_px, 3), dtype=np.uint8)
+        # Tiles which are not in the atlas are always redrawn
+        missing = rows < 0
+        if dirty is not None:
+            dirty = dirty | missing
 
-        # Render the grid
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                cell = self.get(i, j)
+        # Copying many tiles one by one is slower than gathering them all
+        if dirty is not None and 4 * np.count_nonzero(dirty) > dirty.size:
+            dirty = None
 
-                agent_here = np.array_equal(agent_pos, (i, j))
+        if dirty is None:
+            tiles, tile_idx = atlas.take(rows)
 
+            # Gather each pixel row of each tile straight into the frame,
+            # viewed as (grid row, tile pixel row, grid column, tile pixels)
+            tile_rows = (
+                tile_idx.T[:, np.newaxis, :] * tile_size +
+                np.arange(tile_size)[np.newaxis, :, np.newaxis]
+            )
+            frame = out if out.flags.c_contiguous else np.empty(out.shape, dtype=out.dtype)
+            np.take(
+                tiles.reshape(-1, tile_size * 3),
+                np.maximum(tile_rows, 0),
+                axis=0,
+                out=frame.reshape(height, tile_size, width, tile_size * 3)
+            )
+            if frame is not out:
+                np.copyto(out, frame)
+            dirty = missing
+
+        for i, j in zip(*np.nonzero(dirty)):
+            if rows[i, j] >= 0:
+                tile_img = atlas.tile(rows[i, j])
+            else:
+                # Render the tiles which are not in the atlas one by one
+                agent_here = _agent_inside(planes, agent_pos) and (i, j) == tuple(agent_pos)
                 tile_img = Grid.render_tile(
-                    cell,
+                    WorldObj.decode(*planes[i, j]),
                     agent_dir=agent_dir if agent_here else None,
                     carrying=carrying if agent_here else None,
                     highlight=highlight_mask[i, j],
                     tile_size=tile_size
                 )
 
-                ymin = j * tile_size
-                ymax = (j+1) * tile_size
-                xmin = i * tile_size
-                xmax = (i+1) * tile_size
-                img[ymin:ymax, xmin:xmax, :] = tile_img
+            out[j*tile_size:(j+1)*tile_size, i*tile_size:(i+1)*tile_size] = tile_img
 
-        return img
+        return out
+
+    @staticmethod
+    def render_encoding(
+        array,
+        tile_size,
+        agent_pos=None,
+        agent_dir=None,
+        carrying=None,
+        highlight_mask=None,
+        out=None
+    ):
+        """
+        Render a grid encoding at a given scale. This renders the same image
+        as decoding the array and rendering the resulting grid, but looks
+        the tiles up by encoding instead of building the grid objects.
+        """
+
+        # Unseen cells are rendered as empty cells
+        planes = np.where(
+            (array[:, :, 0] == OBJECT_TO_IDX['unseen'])[:, :, np.newaxis],
+            np.array(EMPTY_ENCODING, dtype=np.uint8),
+            array
+        ).astype(np.uint8)
+        width, height, _ = planes.shape
+
+        atlas = Grid.get_tile_atlas(tile_size)
+        rows = Grid.tile_rows(planes, atlas, agent_pos, agent_dir, carrying, highlight_mask)
+
+        if out is None:
+            out = np.empty(shape=(height * tile_size, width * tile_size, 3), dtype=np.uint8)
+
+        return Grid.blit_tiles(
+            out,
+            planes,
+            atlas,
+            rows,
+            agent_pos,
+            agent_dir,
+            carrying,
+            highlight_mask
+        )
+
+    @staticmethod
+    def render_batch(
+        arrays,
+        tile_size,
+        agent_pos=None,
+        agent_dir=None,
+        carrying=None,
+        highlight_masks=None,
+        out=None
+    ):
+        """
+        Render a batch of grid encodings of the same size at a given scale,
+        writing all the frames into a single (N, height, width, 3) buffer.
+        The agent positions and directions can be shared by all the frames
+        (as in agent views) or given per frame, the agents must be within
+        the grids. The carried objects are given by their encodings.
+        """
+
+        num_frames, width, height, _ = arrays.shape
+        unseen = arrays[..., 0] == OBJECT_TO_IDX['unseen']
+
+        if highlight_masks is None:
+            highlight_masks = np.zeros(shape=(num_frames, width, height), dtype=bool)
+
+        atlas = Grid.get_tile_atlas(tile_size)
+
+        # Unseen cells are rendered as empty cells
+        types = np.where(unseen, OBJECT_TO_IDX['empty'], arrays[..., 0])
+        colors = np.where(unseen, 0, arrays[..., 1])
+        states = np.where(unseen, 0, arrays[..., 2])
+
+        rows = atlas.index[types, colors, states, 0, highlight_masks.astype(np.uint8), 0, 0]
+
+        if agent_pos is not None:
+            n = np.arange(num_frames)
+            agent_pos = np.broadcast_to(agent_pos, (num_frames, 2))
+            agent_dir = np.broadcast_to(agent_dir, (num_frames,))
+            i, j = agent_pos[:, 0], agent_pos[:, 1]
+
+            if carrying is None:
+                carrying = np.zeros((num_frames, 3), dtype=np.uint8)
+            carrying = np.asarray(carrying)
+
+            # Empty encodings mean nothing is carried
+            carry_type = carrying[:, 0] * (carrying[:, 0] != OBJECT_TO_IDX['empty'])
+            carry_color = carrying[:, 1] * (carry_type != 0)
+
+            rows[n, i, j] = atlas.index[
+                types[n, i, j],
+                colors[n, i, j],
+                states[n, i, j],
+                agent_dir + 1,
+                highlight_masks[n, i, j].astype(np.uint8),
+                carry_type,
+                carry_color
+            ]
+
+        missing = rows < 0
+        tiles, tile_idx = atlas.take(rows)
+
+        if out is None:
+            out = np.empty(
+                shape=(num_frames, height * tile_size, width * tile_size, 3),
+                dtype=np.uint8
+            )
+
+        # Gather each pixel row of each tile straight into the frames,
+        # buffers that can't be viewed that way are written through a copy
+        tile_rows = (
+            tile_idx.transpose(0, 2, 1)[:, :, np.newaxis, :] * tile_size +
+            np.arange(tile_size)[np.newaxis, np.newaxis, :, np.newaxis]
+        )
+        frames = out if out.flags.c_contiguous else np.empty(out.shape, dtype=out.dtype)
+        np.take(
+            tiles.reshape(-1, tile_size * 3),
+            np.maximum(tile_rows, 0),
+            axis=0,
+            out=frames.reshape(num_frames, height, tile_size, width, tile_size * 3)
+        )
+        if frames is not out:
+            np.copyto(out, frames)
+
+        # Render the tiles which are not in the atlas one by one
+        for n, i, j in zip(*np.nonzero(missing)):
+            agent_here = agent_pos is not None and (i, j) == tuple(agent_pos[n])
+            out[n, j*tile_size:(j+1)*tile_size, i*tile_size:(i+1)*tile_size] = Grid.render_tile(
+                WorldObj.decode(types[n, i, j], colors[n, i, j], states[n, i, j]),
+                agent_dir=agent_dir[n] if agent_here else None,
+                carrying=WorldObj.decode(*carrying[n]) if agent_here else None,
+                highlight=highlight_masks[n, i, j],
+                tile_size=tile_size
+            )
+
+        return out
+
+    def render(
+        self,
+        tile_size,
+        agent_pos=None,
+        agent_dir=None,
+        carrying=None,
+        highlight_mask=None,
+        out=None
+    ):
+        """
+        Render this grid at a given scale
+        :param r: target renderer object
+        :param tile_size: tile size in pixels
+        """
+
+        return Grid.render_encoding(
+            self.planes,
+            tile_size,
+            agent_pos,
+            agent_dir,
+            carrying,
+            highlight_mask,
+            out
+        )
 
     def encode(self, vis_mask=None):
         """
@@ -549,22 +1426,11 @@ class Grid:
         """
 
         if vis_mask is None:
-            vis_mask = np.ones((self.width, self.height), dtype=bool)
+            return self.planes.copy()
 
+        # Cells outside of the visibility mask are left unseen (all zeros)
         array = np.zeros((self.width, self.height, 3), dtype='uint8')
-
-        for i in range(self.width):
-            for j in range(self.height):
-                if vis_mask[i, j]:
-                    v = self.get(i, j)
-
-                    if v is None:
-                        array[i, j, 0] = OBJECT_TO_IDX['empty']
-                        array[i, j, 1] = 0
-                        array[i, j, 2] = 0
-
-                    else:
-                        array[i, j, :] = v.encode()
+        np.copyto(array, self.planes, where=np.asarray(vis_mask, dtype=bool)[:, :, np.newaxis])
 
         return array
 
@@ -590,43 +1456,55 @@ class Grid:
         return grid, vis_mask
 
     def process_vis(grid, agent_pos):
-        mask = np.zeros(shape=(grid.width, grid.height), dtype=np.bool)
+        opaque = np.array(
+            [v is not None and not v.see_behind() for v in grid.grid],
+            dtype=bool
+        ).reshape(grid.height, grid.width).T
 
-        mask[agent_pos[0], agent_pos[1]] = True
+        mask = vis_mask_from_opacity(opaque, agent_pos)
 
-        for j in reversed(range(0, grid.height)):
-            for i in range(0, grid.width-1):
-                if not mask[i, j]:
-                    continue
-
-                cell = grid.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i+1, j] = True
-                if j > 0:
-                    mask[i+1, j-1] = True
-                    mask[i, j-1] = True
+        for i, j in zip(*np.nonzero(~mask)):
+            grid.set(i, j, None)
 
-            for i in reversed(range(1, grid.width)):
-                if not mask[i, j]:
-                    continue
-
-                cell = grid.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i-1, j] = True
-                if j > 0:
-                    mask[i-1, j-1] = True
-                    mask[i, j-1] = True
+        return mask
 
-        for j in range(0, grid.height):
-            for i in range(0, grid.width):
-                if not mask[i, j]:
-                    grid.set(i, j, None)
+# Snapshot of an environment, see MiniGridEnv.get_state()
+EnvState = namedtuple(
+    'EnvState',
+    ['grid', 'agent_pos', 'agent_dir', 'carrying', 'carrying_state',
+     'step_count', 'mission', 'rng_state', 'extras']
+)
+
+# Names of the state attributes of environment classes, indexed by class
+_state_attrs = {}
+
+def _state_attr_names(cls):
+    names = _state_attrs.get(cls)
+    if names is None:
+        names = _state_attrs[cls] = list(dict.fromkeys(
+            name for c in reversed(cls.__mro__) for name in c.__dict__.get('state_attrs', ())
+        ))
+    return names
+
+def _copy_state(value, memo=None):
+    """
+    Copy the containers of an environment attribute, keeping references
+    to the grid objects and other values they hold. With a memo dict, the
+    mutable grid objects are replaced by their copies, see WorldObj.copy(),
+    and other objects such as rooms are deep copied with the same memo.
+    """
 
-        return mask
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, WorldObj):
+        return value if memo is None or value.immutable else value.copy(memo)
+    if memo is not None and hasattr(value, '__dict__') and not isinstance(value, type):
+        return copy.deepcopy(value, memo)
+    if type(value) in (list, tuple, set):
+        return type(value)(_copy_state(v, memo) for v in value)
+    if type(value) is dict:
+        return {_copy_state(k, memo): _copy_state(v, memo) for k, v in value.items()}
+    return value
 
 class MiniGridEnv(gym.Env):
     """
@@ -655,6 +1533,35 @@ class MiniGridEnv(gym.Env):
         # Done completing task
         done = 6
 
+    # Attributes set up by _gen_grid() or changed by step() in subclasses,
+    # which get_state() and layout caches save along with the grid and the
+    # agent. The lists of all the classes of an environment are combined,
+    # other attributes are left as they are when a state is restored.
+    state_attrs = []
+
+    # How place_obj() picks positions. With 'rejection', random positions
+    # are drawn until one is free. With 'free_cells', positions are drawn
+    # among the free cells of the area, which never draws occupied cells
+    # but generates different layouts for the same seed.
+    placement = 'rejection'
+
+    # Cache of generated layouts which reset() restores instead of calling
+    # _gen_grid() again, see gym_minigrid.layouts.LayoutCache and LayoutPool
+    layout_cache = None
+
+    # Whether the layouts generated by _gen_grid() only depend on the seed
+    # and the constructor arguments, which layout caches rely on
+    seeded_layouts = True
+
+    def __new__(cls, *args, **kwargs):
+        env = super().__new__(cls)
+
+        # Constructor arguments, identifying the layouts generated for
+        # each seed along with the class
+        env._init_args = (args, kwargs)
+
+        return env
+
     def __init__(
         self,
         grid_size=None,
@@ -698,6 +1605,14 @@ class MiniGridEnv(gym.Env):
         # Window to use for human rendering mode
         self.window = None
 
+        # Buffer the agent's view is extracted into
+        self._view_buf = None
+
+        # Last rendered frame, along with the atlas rows of its tiles
+        self._frame = None
+        self._frame_rows = None
+        self._frame_atlas = None
+
         # Environment configuration
         self.width = width
         self.height = height
@@ -722,7 +1637,7 @@ class MiniGridEnv(gym.Env):
         # Generate a new random grid at the start of each episode
         # To keep the same grid for each episode, call env.seed() with
         # the same seed before calling env.reset()
-        self._gen_grid(self.width, self.height)
+        self._gen_layout()
 
         # These fields should be defined by _gen_grid
         assert self.agent_pos is not None
@@ -744,9 +1659,92 @@ class MiniGridEnv(gym.Env):
 
     def seed(self, seed=1337):
         # Seed the random number generator
-        self.np_random, _ = seeding.np_random(seed)
+        self.np_random, self._layout_seed = seeding.np_random(seed)
         return [seed]
 
+    def _gen_layout(self):
+        """
+        Generate the grid of a new episode, or restore it from the layout
+        cache if the environment was seeded since the last episode
+        """
+
+        # The layout only depends on the seed right after seeding
+        seed, self._layout_seed = self._layout_seed, None
+
+        cache = self.layout_cache
+        if not self.seeded_layouts or seed is None:
+            cache = None
+
+        if cache is not None and cache.restore(self, seed):
+            return
+
+        self._gen_grid(self.width, self.height)
+
+        if cache is not None:
+            cache.store(self, seed)
+
+    def get_state(self):
+        """
+        Take an immutable snapshot of the environment, which set_state()
+        can restore any number of times, e.g. to search over the outcomes
+        of different actions from the same state
+        """
+
+        carrying = self.carrying
+
+        return EnvState(
+            self.grid.get_state(),
+            _copy_state(self.agent_pos),
+            self.agent_dir,
+            carrying,
+            carrying.get_state() if carrying else None,
+            self.step_count,
+            self.mission,
+            self.np_random.get_state(),
+            tuple((name, _copy_state(getattr(self, name))) for name in _state_attr_names(type(self)))
+        )
+
+    def set_state(self, state):
+        """
+        Restore the environment to a snapshot taken by get_state()
+        """
+
+        grid_state = state.grid
+        if self.grid.width != grid_state.width or self.grid.height != grid_state.height:
+            self.grid = Grid(grid_state.width, grid_state.height)
+        self.grid.set_state(grid_state)
+
+        self.agent_pos = _copy_state(state.agent_pos)
+        self.agent_dir = state.agent_dir
+        self.carrying = state.carrying
+        if state.carrying:
+            state.carrying.set_state(state.carrying_state)
+        self.step_count = state.step_count
+        self.mission = state.mission
+        self.np_random.set_state(state.rng_state)
+
+        for name, value in state.extras:
+            setattr(self, name, _copy_state(value))
+
+    def state_hash(self):
+        """
+        Hash the grid along with the agent position, direction and carried
+        object, e.g. to count the visits to each state of the environment.
+        The keys of the agent are XORed into the 64-bit Zobrist hash of the
+        grid, so hashes are the same in all processes.
+        """
+
+        grid = self.grid
+        agent_keys, carry_keys = agent_zobrist_table(grid.width * grid.height)
+        x, y = self.agent_pos
+        carrying = self.carrying.encode() if self.carrying else EMPTY_ENCODING
+
+        return (
+            grid.hash
+            ^ agent_keys.item(int(x) * grid.height + int(y), int(self.agent_dir))
+            ^ carry_keys.item(*carrying)
+        )
+
     @property
     def steps_remaining(self):
         return self.max_steps - self.step_count
@@ -900,6 +1898,8 @@ class MiniGridEnv(gym.Env):
         :param top: top-left position of the rectangle where to place
         :param size: size of the rectangle where to place
         :param reject_fn: function to filter out potential positions
+        :param max_tries: number of positions drawn before giving up, with
+            the 'rejection' placement (see the placement attribute)
         """
 
         if top is None:
@@ -910,6 +1910,25 @@ class MiniGridEnv(gym.Env):
         if size is None:
             size = (self.grid.width, self.grid.height)
 
+        if self.placement == 'free_cells':
+            pos = self._sample_free_cell(top, size, reject_fn)
+        else:
+            pos = self._sample_pos(top, size, reject_fn, max_tries)
+
+        self.grid.set(*pos, obj)
+
+        if obj is not None:
+            obj.init_pos = pos
+            obj.cur_pos = pos
+
+        return pos
+
+    def _sample_pos(self, top, size, reject_fn, max_tries):
+        """
+        Draw random positions within a rectangle until one is free
+        """
+
+        agent_pos = self.agent_pos
         num_tries = 0
 
         while True:
@@ -920,32 +1939,70 @@ class MiniGridEnv(gym.Env):
 
             num_tries += 1
 
-            pos = np.array((
-                self._rand_int(top[0], min(top[0] + size[0], self.grid.width)),
-                self._rand_int(top[1], min(top[1] + size[1], self.grid.height))
-            ))
+            x = self._rand_int(top[0], min(top[0] + size[0], self.grid.width))
+            y = self._rand_int(top[1], min(top[1] + size[1], self.grid.height))
 
             # Don't place the object on top of another object
-            if self.grid.get(*pos) != None:
+            if self.grid.get(x, y) is not None:
                 continue
 
             # Don't place the object where the agent is
-            if np.array_equal(pos, self.agent_pos):
+            if agent_pos is not None and x == agent_pos[0] and y == agent_pos[1]:
                 continue
 
+            pos = np.array((x, y))
+
             # Check if there is a filtering criterion
             if reject_fn and reject_fn(self, pos):
                 continue
 
             break
 
-        self.grid.set(*pos, obj)
+        return pos
 
-        if obj is not None:
-            obj.init_pos = pos
-            obj.cur_pos = pos
+    def _sample_free_cell(self, top, size, reject_fn, num_draws=4):
+        """
+        Draw a random free position within a rectangle, among the empty
+        cells other than the agent's which reject_fn doesn't filter out
+        """
 
-        return pos
+        grid = self.grid
+        agent_pos = self.agent_pos
+        x0, y0 = top
+        width = min(x0 + size[0], grid.width) - x0
+        height = min(y0 + size[1], grid.height) - y0
+
+        # A few cells of the rectangle are drawn first, which is enough
+        # when most of the rectangle is free
+        for _ in range(num_draws):
+            k = self._rand_int(0, width * height)
+            x, y = x0 + k // height, y0 + k % height
+            if grid.grid[y * grid.width + x] is not None:
+                continue
+            if agent_pos is not None and x == agent_pos[0] and y == agent_pos[1]:
+                continue
+            pos = np.array((x, y))
+            if not (reject_fn and reject_fn(self, pos)):
+                return pos
+
+        # Otherwise draw among the free cells. Rejected cells are swapped
+        # out of the candidates, reject_fn is only called on cells drawn.
+        cells = grid.empty_cells(top, size)
+        if agent_pos is not None:
+            cells = cells[(cells[:, 0] != agent_pos[0]) | (cells[:, 1] != agent_pos[1])]
+
+        num_cells = len(cells)
+        while num_cells > 0:
+            k = self._rand_int(0, num_cells)
+            pos = cells[k].copy()
+
+            if not (reject_fn and reject_fn(self, pos)):
+                return pos
+
+            num_cells -= 1
+            cells[k] = cells[num_cells]
+
+        raise RecursionError('no free position for place_obj')
 
     def put_obj(self, obj, i, j):
         """
@@ -1168,6 +2225,21 @@ class MiniGridEnv(gym.Env):
             done = True
         return done
 
+    def get_view_rotations(self):
+        """
+        Get the number of times the grid is rotated left (counter-clockwise)
+        to produce the agent's partially observable view
+        """
+
+        return self.agent_dir + 1
+
+    def get_view_agent_pos(self):
+        """
+        Get the position of the agent in its partially observable view
+        """
+
+        return (self.agent_view_size // 2, self.agent_view_size - 1)
+
     def gen_obs_grid(self):
         """
         Generate the sub-grid observed by the agent.
@@ -1179,20 +2251,21 @@ class MiniGridEnv(gym.Env):
 
         grid = self.grid.slice(topX, topY, self.agent_view_size, self.agent_view_size)
 
-        for i in range(self.agent_dir + 1):
+        for i in range(self.get_view_rotations()):
             grid = grid.rotate_left()
 
+        agent_pos = self.get_view_agent_pos()
+
         # Process occluders and visibility
         # Note that this incurs some performance cost
         if not self.see_through_walls:
-            vis_mask = grid.process_vis(agent_pos=(self.agent_view_size // 2 , self.agent_view_size - 1))
+            vis_mask = grid.process_vis(agent_pos=agent_pos)
         else:
             vis_mask = np.ones(shape=(grid.width, grid.height), dtype=np.bool)
 
         # Make it so the agent sees what it's carrying
         # We do this by placing the carried object at the agent's position
         # in the agent's partially observable view
-        agent_pos = grid.width // 2, grid.height - 1
         if self.carrying:
             grid.set(*agent_pos, self.carrying)
         else:
@@ -1200,15 +2273,51 @@ class MiniGridEnv(gym.Env):
 
         return grid, vis_mask
 
+    def gen_obs_view(self):
+        """
+        Generate the encoding of the sub-grid observed by the agent, along
+        with its visibility mask. This produces the same output as encoding
+        the result of gen_obs_grid(), but crops the view straight out of
+        the grid planes so that no intermediate Grid is built.
+        """
+
+        topX, topY, botX, botY = self.get_view_exts()
+        size = self.agent_view_size
+
+        # Reuse the buffer the view is gathered into between steps
+        if self._view_buf is None or self._view_buf.shape[0] != size:
+            self._view_buf = np.empty((size, size, 3), dtype=np.uint8)
+
+        view = self.grid.encode_slice(
+            topX,
+            topY,
+            size,
+            self.get_view_rotations(),
+            out=self._view_buf
+        )
+
+        agent_pos = self.get_view_agent_pos()
+
+        # Process occluders and visibility
+        if not self.see_through_walls:
+            vis_mask = compute_vis_mask(view, agent_pos)
+        else:
+            vis_mask = np.ones(shape=(size, size), dtype=bool)
+
+        # Make it so the agent sees what it's carrying
+        view[agent_pos] = self.carrying.encode() if self.carrying else EMPTY_ENCODING
+
+        image = np.zeros((size, size, 3), dtype='uint8')
+        np.copyto(image, view, where=vis_mask[:, :, np.newaxis])
+
+        return image, vis_mask
+
     def gen_obs(self):
         """
         Generate the agent's view (partially observable, low-resolution encoding)
         """
 
-        grid, vis_mask = self.gen_obs_grid()
-
-        # Encode the partially observable view into a numpy array
-        image = grid.encode(vis_mask)
+        image, vis_mask = self.gen_obs_view()
 
         assert hasattr(self, 'mission'), "environments must define a textual mission string"
 
@@ -1229,14 +2338,13 @@ class MiniGridEnv(gym.Env):
         Render an agent observation for visualization
         """
 
-        grid, vis_mask = Grid.decode(obs)
-
-        # Render the whole grid
-        img = grid.render(
+        # Render the whole view, highlighting the cells which were seen
+        img = Grid.render_encoding(
+            obs,
             tile_size,
-            agent_pos=(self.agent_view_size // 2, self.agent_view_size - 1),
+            agent_pos=self.get_view_agent_pos(),
             agent_dir=3,
-            highlight_mask=vis_mask
+            highlight_mask=obs[:, :, 0] != OBJECT_TO_IDX['unseen']
         )
 
         return img
@@ -1257,7 +2365,7 @@ class MiniGridEnv(gym.Env):
             self.window.show(block=False)
 
         # Compute which cells are visible to the agent
-        _, vis_mask = self.gen_obs_grid()
+        _, vis_mask = self.gen_obs_view()
 
         # Compute the world coordinates of the bottom-left corner
         # of the agent's view area
@@ -1266,34 +2374,59 @@ class MiniGridEnv(gym.Env):
         top_left = self.agent_pos + f_vec * (self.agent_view_size-1) - r_vec * (self.agent_view_size // 2)
 
         # Mask of which cells to highlight
-        highlight_mask = np.zeros(shape=(self.width, self.height), dtype=np.bool)
-
-        # For each cell in the visibility mask
-        for vis_j in range(0, self.agent_view_size):
-            for vis_i in range(0, self.agent_view_size):
-                # If this cell is not visible, don't highlight it
-                if not vis_mask[vis_i, vis_j]:
-                    continue
-
-                # Compute the world coordinates of this cell
-                abs_i, abs_j = top_left - (f_vec * vis_j) + (r_vec * vis_i)
-
-                if abs_i < 0 or abs_i >= self.width:
-                    continue
-                if abs_j < 0 or abs_j >= self.height:
-                    continue
+        highlight_mask = np.zeros(shape=(self.width, self.height), dtype=bool)
+
+        # Compute the world coordinates of the visible cells
+        vis_i, vis_j = np.nonzero(vis_mask)
+        abs_i = top_left[0] - f_vec[0] * vis_j + r_vec[0] * vis_i
+        abs_j = top_left[1] - f_vec[1] * vis_j + r_vec[1] * vis_i
+        inside = (abs_i >= 0) & (abs_i < self.width) & (abs_j >= 0) & (abs_j < self.height)
+
+        # Mark these cells to be highlighted
+        highlight_mask[abs_i[inside], abs_j[inside]] = True
+
+        if not highlight:
+            highlight_mask = None
+
+        # Render the whole grid, only redrawing the tiles of the cells which
+        # changed since the last frame
+        atlas = Grid.get_tile_atlas(tile_size)
+        planes = self.grid.planes
+        rows = Grid.tile_rows(
+            planes,
+            atlas,
+            self.agent_pos,
+            self.agent_dir,
+            self.carrying,
+            highlight_mask
+        )
 
-                # Mark this cell to be highlighted
-                highlight_mask[abs_i, abs_j] = True
+        frame_shape = (self.grid.height * tile_size, self.grid.width * tile_size, 3)
+        if (
+            self._frame is None or
+            self._frame.shape != frame_shape or
+            self._frame_atlas is not atlas
+        ):
+            self._frame = np.empty(frame_shape, dtype=np.uint8)
+            dirty = None
+        else:
+            dirty = rows != self._frame_rows
 
-        # Render the whole grid
-        img = self.grid.render(
-            tile_size,
+        Grid.blit_tiles(
+            self._frame,
+            planes,
+            atlas,
+            rows,
             self.agent_pos,
             self.agent_dir,
             self.carrying,
-            highlight_mask=highlight_mask if highlight else None
+            highlight_mask,
+            dirty=dirty
         )
+        self._frame_rows = rows
+        self._frame_atlas = atlas
+
+        img = self._frame.copy()
 
         if mode == 'human':
             self.window.show_img(img)
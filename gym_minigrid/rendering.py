@@ -1,5 +1,6 @@
 import math
 import numpy as np
+from .lru import LRUCache
 
 def downsample(img, factor):
     """
@@ -17,25 +18,28 @@ def downsample(img, factor):
 
 def fill_coords(img, fn, color):
     """
-    Fill pixels of an image with coordinates matching a filter function
+    Fill pixels of an image with coordinates matching a filter function.
+    The filter function is evaluated on arrays holding the coordinates of
+    all the pixels at once.
     """
 
-    for y in range(img.shape[0]):
-        for x in range(img.shape[1]):
-            yf = (y + 0.5) / img.shape[0]
-            xf = (x + 0.5) / img.shape[1]
-            if fn(xf, yf):
-                img[y, x] = color
+    yf = (np.arange(img.shape[0]) + 0.5) / img.shape[0]
+    xf = (np.arange(img.shape[1]) + 0.5) / img.shape[1]
+    mask = fn(xf[np.newaxis, :], yf[:, np.newaxis])
+    img[np.broadcast_to(mask, img.shape[:2])] = color
 
     return img
 
 def rotate_fn(fin, cx, cy, theta):
+    cos = math.cos(-theta)
+    sin = math.sin(-theta)
+
     def fout(x, y):
         x = x - cx
         y = y - cy
 
-        x2 = cx + x * math.cos(-theta) - y * math.sin(-theta)
-        y2 = cy + y * math.cos(-theta) + x * math.sin(-theta)
+        x2 = cx + x * cos - y * sin
+        y2 = cy + y * cos + x * sin
 
         return fin(x2, y2)
 
@@ -55,19 +59,19 @@ def point_in_line(x0, y0, x1, y1, r):
 
     def fn(x, y):
         # Fast, early escape test
-        if x < xmin or x > xmax or y < ymin or y > ymax:
-            return False
+        inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
 
-        q = np.array([x, y])
-        pq = q - p0
+        pqx = x - p0[0]
+        pqy = y - p0[1]
 
         # Closest point on line
-        a = np.dot(pq, dir)
+        a = pqx * dir[0] + pqy * dir[1]
         a = np.clip(a, 0, dist)
-        p = p0 + a * dir
+        px = p0[0] + a * dir[0]
+        py = p0[1] + a * dir[1]
 
-        dist_to_line = np.linalg.norm(q - p)
-        return dist_to_line <= r
+        dist_to_line = np.sqrt((x - px) * (x - px) + (y - py) * (y - py))
+        return inside & (dist_to_line <= r)
 
     return fn
 
@@ -78,7 +82,7 @@ def point_in_circle(cx, cy, r):
 
 def point_in_rect(xmin, xmax, ymin, ymax):
     def fn(x, y):
-        return x >= xmin and x <= xmax and y >= ymin and y <= ymax
+        return (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
     return fn
 
 def point_in_triangle(a, b, c):
@@ -86,25 +90,29 @@ def point_in_triangle(a, b, c):
     b = np.array(b)
     c = np.array(c)
 
+    v0 = c - a
+    v1 = b - a
+
+    # Compute the dot products that don't depend on the point
+    dot00 = np.dot(v0, v0)
+    dot01 = np.dot(v0, v1)
+    dot11 = np.dot(v1, v1)
+    inv_denom = 1 / (dot00 * dot11 - dot01 * dot01)
+
     def fn(x, y):
-        v0 = c - a
-        v1 = b - a
-        v2 = np.array((x, y)) - a
+        v2x = x - a[0]
+        v2y = y - a[1]
 
         # Compute dot products
-        dot00 = np.dot(v0, v0)
-        dot01 = np.dot(v0, v1)
-        dot02 = np.dot(v0, v2)
-        dot11 = np.dot(v1, v1)
-        dot12 = np.dot(v1, v2)
+        dot02 = v0[0] * v2x + v0[1] * v2y
+        dot12 = v1[0] * v2x + v1[1] * v2y
 
         # Compute barycentric coordinates
-        inv_denom = 1 / (dot00 * dot11 - dot01 * dot01)
         u = (dot11 * dot02 - dot01 * dot12) * inv_denom
         v = (dot00 * dot12 - dot01 * dot02) * inv_denom
 
         # Check if point is in triangle
-        return (u >= 0) and (v >= 0) and (u + v) < 1
+        return (u >= 0) & (v >= 0) & ((u + v) < 1)
 
     return fn
 
@@ -116,3 +124,26 @@ def highlight_img(img, color=(255, 255, 255), alpha=0.30):
     blend_img = img + alpha * (np.array(color, dtype=np.uint8) - img)
     blend_img = blend_img.clip(0, 255).astype(np.uint8)
     img[:, :, :] = blend_img
+
+class TileCache(LRUCache):
+    """
+    Least recently used cache of rendered tiles, holding at most `capacity`
+    tiles. Counts its hits, misses and evictions, along with the number of
+    bytes used by the cached tiles.
+    """
+
+    def __init__(self, capacity=1024):
+        super().__init__(capacity)
+        self.nbytes = 0
+
+    def _added(self, img):
+        self.nbytes += img.nbytes
+
+    def _removed(self, img):
+        self.nbytes -= img.nbytes
+
+    def stats(self):
+        stats = super().stats()
+        stats['bytes'] = self.nbytes
+
+        return stats
@@ -66,6 +66,8 @@ class RoomGrid(MiniGridEnv):
     This is meant to serve as a base class for other environments.
     """
 
+    state_attrs = ['room_grid']
+
     def __init__(
         self,
         room_size=7,
@@ -0,0 +1,185 @@
+import os
+import threading
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from .counts import CountTable, HashedCountTable
+
+def _attach_shared(cls, kwargs):
+    return cls(**kwargs)
+
+# Serializes the attachments made without registering the blocks
+_attach_lock = threading.Lock()
+
+def _open_block(name, size):
+    """
+    Create a shared memory block, or attach to an existing one by name.
+    Attached blocks are not registered with the resource tracker of this
+    process, which would free them when the process exits, as with
+    track=False from Python 3.13. Processes started by multiprocessing
+    share the tracker of their parent, where the block stays registered.
+    """
+
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size)
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+class SharedCountTable(CountTable):
+    """
+    Dense count table held in a shared memory block, which all the
+    processes the table is passed to increment. Increments are not
+    atomic, concurrent increments of the same entry can be lost, which
+    count-based bonuses tolerate.
+
+    The table is created by the process that doesn't give a `name`,
+    other processes attach to it by name, which pickling the table does.
+    """
+
+    def __init__(self, shape, dtype=np.uint32, name=None):
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+
+        self.owner = name is None
+        self._shm = _open_block(name, size)
+        self.counts = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf)
+        if self.owner:
+            self.counts[...] = 0
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __reduce__(self):
+        kwargs = dict(shape=self.counts.shape, dtype=self.counts.dtype, name=self.name)
+        return _attach_shared, (type(self), kwargs)
+
+    def close(self):
+        """
+        Detach from the shared block, which is freed when the process
+        that created the table closes it
+        """
+
+        if self.counts is None:
+            return
+
+        # The block can only be closed once no array refers to it
+        self.counts = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+class SharedHashedCountTable(HashedCountTable):
+    """
+    Hashed count table held in a shared memory block, see
+    SharedCountTable. The table can't grow, raising an error once all
+    `capacity` slots are taken. Processes inserting different keys in
+    the same slot at the same time may merge their counts.
+    """
+
+    def __init__(self, capacity=1 << 20, dtype=np.uint32, name=None):
+        assert capacity > 0 and capacity & (capacity - 1) == 0, 'capacity must be a power of 2'
+        dtype = np.dtype(dtype)
+        size = capacity * (8 + dtype.itemsize)
+
+        # Load factor of the private tables loaded from snapshots
+        self.max_load = 0.5
+        self.owner = name is None
+        self._shm = _open_block(name, size)
+        self.keys = np.ndarray(capacity, dtype=np.uint64, buffer=self._shm.buf)
+        self.counts = np.ndarray(capacity, dtype=dtype, buffer=self._shm.buf, offset=capacity * 8)
+        if self.owner:
+            self.keys[:] = 0
+            self.counts[:] = 0
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def size(self):
+        return int(np.count_nonzero(self.keys))
+
+    @size.setter
+    def size(self, value):
+        # The size is counted from the shared keys
+        pass
+
+    def __reduce__(self):
+        kwargs = dict(capacity=len(self.keys), dtype=self.counts.dtype, name=self.name)
+        return _attach_shared, (type(self), kwargs)
+
+    def increment(self, key, value=1):
+        i, key = self._slot(key)
+
+        if self.keys.item(i) == 0:
+            self.keys[i] = key
+
+        count = self.counts.item(i) + value
+        self.counts[i] = count
+
+        return count
+
+    def close(self):
+        if self.counts is None:
+            return
+
+        self.keys = None
+        self.counts = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+class CountSnapshotter:
+    """
+    Save snapshots of a count table every `interval` seconds from a
+    background thread, e.g. to checkpoint a table shared by workers.
+    Snapshots replace the file at `path` at once, they can be loaded
+    with the load() method of the table class.
+    """
+
+    def __init__(self, table, path, interval=60.0):
+        self.table = table
+        self.path = path
+        self.interval = interval
+        self.num_snapshots = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Save a snapshot of the table now
+        """
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            self.table.save(f)
+        os.replace(tmp_path, self.path)
+        self.num_snapshots += 1
+
+    def stop(self, snapshot=True):
+        """
+        Stop taking snapshots, taking a last one if `snapshot` is set
+        """
+
+        self._stop.set()
+        self._thread.join()
+        if snapshot:
+            self.snapshot()
@@ -0,0 +1,280 @@
+import os
+import tempfile
+import numpy as np
+from .minigrid import *
+
+# Version of the tile rendering, part of the name of cached atlases so
+# that atlases rendered by older versions are not loaded
+ATLAS_VERSION = 1
+
+# Encoding used in the atlas index when the agent carries nothing
+NO_CARRYING = (OBJECT_TO_IDX['unseen'], 0, 0)
+
+def _cell_encodings():
+    """
+    List the encodings of all the cells that can appear in a grid
+    """
+
+    encodings = [EMPTY_ENCODING]
+
+    for type_idx, obj_type in sorted(IDX_TO_OBJECT.items()):
+        if obj_type in ['unseen', 'empty', 'agent']:
+            continue
+        states = STATE_TO_IDX.values() if obj_type == 'door' else [0]
+        for color_idx in sorted(IDX_TO_COLOR):
+            for state in states:
+                encodings.append((type_idx, color_idx, state))
+
+    return encodings
+
+def atlas_keys():
+    """
+    List the (cell encoding, agent direction, highlight, carrying encoding)
+    combinations stored in the atlas. The agent can only be drawn over cells
+    it can walk over, or over the object it carries in agent observations.
+    """
+
+    cells = _cell_encodings()
+    carried = [NO_CARRYING] + [e for e in cells if CAN_PICKUP[e[0], e[2]]]
+
+    keys = []
+
+    for highlight in [False, True]:
+        for enc in cells:
+            keys.append((enc, None, highlight, NO_CARRYING))
+
+        for enc in cells:
+            if not (CAN_OVERLAP[enc[0], enc[2]] or CAN_PICKUP[enc[0], enc[2]]):
+                continue
+            for agent_dir in range(4):
+                for carrying in carried:
+                    keys.append((enc, agent_dir, highlight, carrying))
+
+    return keys
+
+def _decode(enc):
+    if enc in [EMPTY_ENCODING, NO_CARRYING]:
+        return None
+    return WorldObj.decode(*enc)
+
+class TileAtlas:
+    """
+    All the tiles of a given size that rendering can produce, rasterized
+    ahead of time into a single (num_tiles, tile_size, tile_size, 3) array,
+    along with an index table mapping the tile keys to rows of that array.
+
+    Atlases can be saved to a cache directory and loaded back as memory
+    mapped arrays, so that the processes using the same cache directory
+    share a single copy of the tiles instead of each rendering their own.
+
+    Lazy atlases have no tiles array, they rasterize their tiles the first
+    time they are needed and keep them in a TileCache, Grid.tile_cache by
+    default, which bounds the memory they use.
+    """
+
+    def __init__(self, tiles, index, tile_size, subdivs=3, keys=None, cache=None):
+        self.tiles = tiles
+        self.index = index
+        self.tile_size = tile_size
+        self.subdivs = subdivs
+
+        # Keys of the tiles of lazy atlases, along with the cache of
+        # the tiles rasterized so far
+        self.keys = keys
+        self.cache = cache
+
+    @staticmethod
+    def new_index():
+        """
+        Create an empty index table, indexed by the cell encoding, the agent
+        direction plus one, the highlight flag and the carried object's type
+        and color
+        """
+
+        num_types = max(IDX_TO_OBJECT) + 1
+
+        return np.full(
+            (num_types, len(COLOR_TO_IDX), len(STATE_TO_IDX), 5, 2, num_types, len(COLOR_TO_IDX)),
+            -1,
+            dtype=np.int32
+        )
+
+    @classmethod
+    def lazy(cls, tile_size=TILE_PIXELS, subdivs=3, cache=None):
+        """
+        Create an atlas whose tiles are only rasterized the first time
+        they are needed, and kept in a cache of tiles
+        """
+
+        keys = atlas_keys()
+        index = cls.new_index()
+
+        for i, (enc, agent_dir, highlight, carrying) in enumerate(keys):
+            index[enc + (0 if agent_dir is None else agent_dir + 1, int(highlight)) + carrying[:2]] = i
+
+        if cache is None:
+            cache = Grid.tile_cache
+
+        return cls(None, index, tile_size, subdivs, keys, cache)
+
+    @classmethod
+    def build(cls, tile_size=TILE_PIXELS, subdivs=3):
+        """
+        Rasterize all the tiles of a given size
+        """
+
+        atlas = cls.lazy(tile_size, subdivs)
+        tiles = np.stack([atlas.rasterize(i) for i in range(len(atlas.keys))])
+
+        return cls(tiles, atlas.index, tile_size, subdivs)
+
+    def rasterize(self, i):
+        """
+        Rasterize the tile in a row of the atlas
+        """
+
+        enc, agent_dir, highlight, carrying = self.keys[i]
+        img = Grid.rasterize_tile(
+            _decode(enc),
+            agent_dir,
+            _decode(carrying),
+            highlight,
+            self.tile_size,
+            self.subdivs
+        )
+
+        return img.astype(np.uint8)
+
+    def tile(self, i):
+        """
+        Get the tile in a row of the atlas, rasterizing the tiles of lazy
+        atlases which are not in their cache
+        """
+
+        if self.tiles is not None:
+            return self.tiles[i]
+
+        key = (self.tile_size, self.subdivs, i)
+        img = self.cache.get(key)
+        if img is None:
+            img = self.rasterize(i)
+            self.cache.put(key, img)
+
+        return img
+
+    def take(self, rows):
+        """
+        Get an array holding the tiles in the given rows of the atlas,
+        along with the rows of that array holding them. Lazy atlases
+        gather the tiles from their cache, rows of -1 get blank tiles.
+        """
+
+        if self.tiles is not None:
+            return self.tiles, rows
+
+        unique, inverse = np.unique(rows, return_inverse=True)
+        tiles = np.zeros((len(unique), self.tile_size, self.tile_size, 3), dtype=np.uint8)
+        for n, i in enumerate(unique.tolist()):
+            if i >= 0:
+                tiles[n] = self.tile(i)
+
+        return tiles, inverse.reshape(rows.shape)
+
+    @staticmethod
+    def cache_paths(cache_dir, tile_size, subdivs=3):
+        """
+        Get the paths of the tile and index arrays of a cached atlas
+        """
+
+        name = 'tiles_%d_%d_v%d' % (tile_size, subdivs, ATLAS_VERSION)
+
+        return (
+            os.path.join(cache_dir, name + '.npy'),
+            os.path.join(cache_dir, name + '_index.npy')
+        )
+
+    def save(self, cache_dir):
+        """
+        Save the atlas into a cache directory. The arrays are written to
+        temporary files first, so that processes loading the atlas at the
+        same time never see partially written files.
+        """
+
+        assert self.tiles is not None, 'lazy atlases can\'t be saved, see build()'
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # The index is written last, and loading starts from the index
+        paths = self.cache_paths(cache_dir, self.tile_size, self.subdivs)
+        for path, array in zip(paths, [self.tiles, self.index]):
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.npy')
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, cache_dir, tile_size=TILE_PIXELS, subdivs=3, mmap=True):
+        """
+        Load an atlas from a cache directory, memory mapping its tiles.
+        Returns None if the atlas is not in the cache.
+        """
+
+        tiles_path, index_path = cls.cache_paths(cache_dir, tile_size, subdivs)
+        if not os.path.exists(index_path):
+            return None
+
+        index = np.load(index_path)
+        tiles = np.load(tiles_path, mmap_mode='r' if mmap else None)
+
+        return cls(tiles, index, tile_size, subdivs)
+
+    @classmethod
+    def load_or_build(cls, cache_dir=None, tile_size=TILE_PIXELS, subdivs=3):
+        """
+        Load an atlas from a cache directory, building and saving it first
+        if it isn't there yet. Without a cache directory, the atlas is
+        built in memory.
+        """
+
+        if cache_dir is None:
+            return cls.build(tile_size, subdivs)
+
+        atlas = cls.load(cache_dir, tile_size, subdivs)
+        if atlas is None:
+            cls.build(tile_size, subdivs).save(cache_dir)
+            atlas = cls.load(cache_dir, tile_size, subdivs)
+
+        return atlas
+
+    def lookup(self, enc, agent_dir=None, highlight=False, carrying=None):
+        """
+        Get the row of the atlas holding a tile given by encodings,
+        or -1 if the tile is not in the atlas
+        """
+
+        agent_dir = 0 if agent_dir is None else agent_dir + 1
+        carrying = NO_CARRYING if carrying is None else carrying
+
+        return int(self.index[tuple(enc) + (agent_dir, int(highlight)) + tuple(carrying[:2])])
+
+    def get(self, obj, agent_dir=None, carrying=None, highlight=False):
+        """
+        Get the tile for the given objects, or None if it's not in the atlas
+        """
+
+        enc = obj.encode() if obj else EMPTY_ENCODING
+        carrying = carrying.encode() if carrying else None
+
+        i = self.lookup(enc, agent_dir, highlight, carrying)
+        if i < 0:
+            return None
+
+        return self.tile(i)
+
+    def install(self):
+        """
+        Make Grid.render_tile() use this atlas for its tile size
+        """
+
+        Grid.tile_atlases[(self.tile_size, self.subdivs)] = self
+
+        return self
@@ -0,0 +1,663 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from gym import spaces
+from .minigrid import *
+
+# Hooks of MiniGridEnv that the batched engine reimplements with array
+# operations, environments can't override these to be batched
+BATCHED_METHODS = [
+    'step',
+    'gen_obs',
+    'gen_obs_view',
+    'get_view_exts',
+    'get_view_rotations',
+    'get_view_agent_pos',
+    '_reward',
+]
+
+# Per view width tables used by batch_vis_mask()
+_batch_vis_tables = {}
+
+def batch_vis_mask(opaque, agent_pos):
+    """
+    Compute the visibility masks of a batch of views, given a (N, width,
+    height) mask of the cells that block the view and the position of the
+    agent, shared by all the views. This runs the bitset propagation of
+    vis_mask_from_opacity() on all the views at once.
+    """
+
+    num_views, width, height = opaque.shape
+
+    # The bitsets are stored as int64 for the whole batch
+    if width > 62:
+        return np.stack([vis_mask_from_opacity(m, agent_pos) for m in opaque])
+
+    if width not in _batch_vis_tables:
+        powers = np.int64(1) << np.arange(width, dtype=np.int64)
+        shifts = np.arange(width, dtype=np.int64)
+        _batch_vis_tables[width] = (powers, powers[::-1].copy(), shifts)
+
+    powers, rev_powers, shifts = _batch_vis_tables[width]
+
+    def reverse(rows):
+        return ((rows[:, np.newaxis] >> shifts) & 1).dot(rev_powers)
+
+    # Bitsets of the cells each row lets the view through, and their
+    # bit reversal for propagating the view leftwards
+    clear = ~opaque
+    clear_rows = np.tensordot(clear, powers, axes=([1], [0]))
+    clear_rows_rev = np.tensordot(clear, rev_powers, axes=([1], [0]))
+
+    full = (1 << width) - 1
+    inner = full >> 1
+
+    rows = np.zeros((num_views, height), dtype=np.int64)
+    mask = np.full(num_views, 1 << int(agent_pos[0]), dtype=np.int64)
+
+    for j in range(agent_pos[1], -1, -1):
+        if j != agent_pos[1] and not mask.any():
+            break
+
+        # Propagate right through the runs of clear cells
+        clear = clear_rows[:, j]
+        seeds = mask & clear
+        mask = (mask | ((clear + seeds) ^ clear) | seeds) & full
+        seen = mask & clear & inner
+        above = seen | (seen << 1)
+
+        # Propagate left on the bit-reversed rows
+        clear = clear_rows_rev[:, j]
+        mask = reverse(mask)
+        seeds = mask & clear
+        mask = (mask | ((clear + seeds) ^ clear) | seeds) & full
+        seen = mask & clear & inner
+        above |= reverse((seen | (seen << 1)) & full)
+
+        rows[:, j] = reverse(mask)
+        mask = above & full
+
+    return (rows[:, np.newaxis, :] >> shifts[:, np.newaxis]) & 1 == 1
+
+class BatchMiniGrid:
+    """
+    Batch of MiniGrid environments stepped together. The worlds are held
+    as stacked encoding planes along with arrays of agent positions,
+    directions and carried objects, and the actions of MiniGridEnv.step()
+    are applied to the whole batch with numpy operations.
+
+    The environment instances only generate the layouts: reset() calls
+    their reset() method and copies the resulting grids into the batch
+    arrays. Environments reaching the end of an episode in step() are
+    reset automatically, and the observations returned for them are the
+    first ones of the next episode. Wrappers around the environments are
+    not applied to the batch.
+    """
+
+    def __init__(self, envs):
+        self.envs = [env.unwrapped for env in envs]
+        assert len(self.envs) > 0
+
+        env = self.envs[0]
+        self.num_envs = len(self.envs)
+        self.width = env.width
+        self.height = env.height
+        self.agent_view_size = env.agent_view_size
+        self.actions = env.actions
+        self.action_space = env.action_space
+        self.observation_space = env.observation_space
+
+        for env in self.envs:
+            self._check_env(env)
+
+        num_cells = self.width * self.height
+
+        # Cell encodings of each world, stored as in Grid, with a wall
+        # encoding after the last cell for the positions out of the grid
+        self._codes = np.zeros((self.num_envs, num_cells + 1, 3), dtype=np.uint8)
+        self._codes[:, -1] = WALL_ENCODING
+
+        # Encodings of the contents of the boxes in each cell
+        self._contents = np.zeros_like(self._codes)
+
+        self.agent_pos = np.zeros((self.num_envs, 2), dtype=np.int64)
+        self.agent_dir = np.zeros(self.num_envs, dtype=np.int64)
+        self.carrying = np.zeros((self.num_envs, 3), dtype=np.uint8)
+        self.carrying_contents = np.zeros((self.num_envs, 3), dtype=np.uint8)
+        self.step_count = np.zeros(self.num_envs, dtype=np.int64)
+        self.max_steps = np.zeros(self.num_envs, dtype=np.int64)
+        self.see_through_walls = np.zeros(self.num_envs, dtype=bool)
+        self.missions = [None] * self.num_envs
+
+        size = self.agent_view_size
+
+        # Offsets of the top-left corner of the agent view for each
+        # direction, and of the view cells for each rotation of the view
+        self._view_tops = np.array([
+            (0, -(size // 2)),
+            (-(size // 2), 0),
+            (-size + 1, -(size // 2)),
+            (-(size // 2), -size + 1),
+        ])
+        offsets = [Grid.view_offsets(size, rot) for rot in range(4)]
+        self._view_dx = np.stack([dx for dx, _ in offsets])
+        self._view_dy = np.stack([dy for _, dy in offsets])
+        self._view_buf = np.empty((self.num_envs, size, size, 3), dtype=np.uint8)
+
+        self._dir_to_vec = np.array(DIR_TO_VEC)
+        self._env_idx = np.arange(self.num_envs)
+
+    def _check_env(self, env):
+        if (env.width, env.height) != (self.width, self.height):
+            raise ValueError('all environments must have the same grid size')
+        if env.agent_view_size != self.agent_view_size:
+            raise ValueError('all environments must have the same view size')
+
+        for name in BATCHED_METHODS:
+            overridden = getattr(type(env), name) is not getattr(MiniGridEnv, name)
+            if overridden or name in vars(env):
+                raise ValueError(
+                    '%s overrides MiniGridEnv.%s and can\'t be batched' %
+                    (type(env).__name__, name)
+                )
+
+    def _encode_obj(self, obj):
+        """
+        Get the encoding of an object and of the contents of a box
+        """
+
+        if obj is None:
+            return EMPTY_ENCODING, EMPTY_ENCODING
+
+        # Objects whose type is an alias can't be told apart once encoded
+        if IDX_TO_OBJECT[OBJECT_TO_IDX[obj.type]] != obj.type:
+            raise ValueError('objects of type %s can\'t be batched' % obj.type)
+
+        contents = EMPTY_ENCODING
+        if obj.type == 'box' and obj.contains is not None:
+            contents, nested = self._encode_obj(obj.contains)
+            if nested != EMPTY_ENCODING:
+                raise ValueError('nested boxes can\'t be batched')
+
+        return obj.encode(), contents
+
+    def _load(self, n):
+        """
+        Copy the state of an environment into the batch arrays
+        """
+
+        env = self.envs[n]
+        grid = env.grid
+        self._check_env(env)
+
+        self._codes[n, :-1] = grid.planes.reshape(-1, 3)
+        self._contents[n] = EMPTY_ENCODING
+
+        for k, v in enumerate(grid.grid):
+            if v is None:
+                continue
+            i, j = k % grid.width, k // grid.width
+            _, contents = self._encode_obj(v)
+            self._contents[n, i * self.height + j] = contents
+
+        self.carrying[n], self.carrying_contents[n] = self._encode_obj(env.carrying)
+
+        self.agent_pos[n] = env.agent_pos
+        self.agent_dir[n] = env.agent_dir
+        self.step_count[n] = env.step_count
+        self.max_steps[n] = env.max_steps
+        self.see_through_walls[n] = env.see_through_walls
+        self.missions[n] = env.mission
+
+    @property
+    def planes(self):
+        """
+        View of the (N, width, height, 3) cell encodings of the worlds
+        """
+
+        return self._codes[:, :-1].reshape(
+            self.num_envs, self.width, self.height, 3
+        )
+
+    def seed(self, seed=None):
+        """
+        Seed the environments with consecutive seeds
+        """
+
+        if seed is None:
+            return [env.seed(None)[0] for env in self.envs]
+        return [env.seed(seed + n)[0] for n, env in enumerate(self.envs)]
+
+    def reset(self):
+        for n, env in enumerate(self.envs):
+            env.reset()
+            self._load(n)
+
+        return self.gen_obs()
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        assert actions.shape == (self.num_envs,)
+        assert ((actions >= 0) & (actions < len(self.actions))).all(), "unknown action"
+
+        self.step_count += 1
+
+        rewards = np.zeros(self.num_envs, dtype=np.float64)
+        dones = np.zeros(self.num_envs, dtype=bool)
+
+        # Get the cells in front of the agents
+        fwd_pos = self.agent_pos + self._dir_to_vec[self.agent_dir]
+        inside = (
+            (fwd_pos[:, 0] >= 0) & (fwd_pos[:, 0] < self.width) &
+            (fwd_pos[:, 1] >= 0) & (fwd_pos[:, 1] < self.height)
+        )
+        fwd_idx = np.where(
+            inside,
+            fwd_pos[:, 0] * self.height + fwd_pos[:, 1],
+            self.width * self.height
+        )
+        fwd_cell = self._codes[self._env_idx, fwd_idx]
+        fwd_type = fwd_cell[:, 0]
+        fwd_state = fwd_cell[:, 2]
+        fwd_empty = fwd_type == OBJECT_TO_IDX['empty']
+        carrying_none = self.carrying[:, 0] == OBJECT_TO_IDX['empty']
+
+        # Rotate left
+        sel = actions == self.actions.left
+        self.agent_dir[sel] = (self.agent_dir[sel] - 1) % 4
+
+        # Rotate right
+        sel = actions == self.actions.right
+        self.agent_dir[sel] = (self.agent_dir[sel] + 1) % 4
+
+        # Move forward
+        sel = actions == self.actions.forward
+        move = sel & CAN_OVERLAP[fwd_type, fwd_state]
+        self.agent_pos[move] = fwd_pos[move]
+        goal = sel & (fwd_type == OBJECT_TO_IDX['goal'])
+        rewards[goal] = 1 - 0.9 * (self.step_count[goal] / self.max_steps[goal])
+        dones |= goal
+        dones |= sel & (fwd_type == OBJECT_TO_IDX['lava'])
+
+        # Pick up an object
+        sel = (actions == self.actions.pickup) & CAN_PICKUP[fwd_type, fwd_state] & carrying_none
+        n, idx = self._env_idx[sel], fwd_idx[sel]
+        self.carrying[sel] = fwd_cell[sel]
+        self.carrying_contents[sel] = self._contents[n, idx]
+        self._codes[n, idx] = EMPTY_ENCODING
+        self._contents[n, idx] = EMPTY_ENCODING
+
+        # Drop an object
+        sel = (actions == self.actions.drop) & fwd_empty & ~carrying_none
+        n, idx = self._env_idx[sel], fwd_idx[sel]
+        self._codes[n, idx] = self.carrying[sel]
+        self._contents[n, idx] = self.carrying_contents[sel]
+        self.carrying[sel] = EMPTY_ENCODING
+        self.carrying_contents[sel] = EMPTY_ENCODING
+
+        # Toggle/activate an object
+        sel = actions == self.actions.toggle
+
+        # Doors open and close, locked doors open with a key of their color
+        door = sel & (fwd_type == OBJECT_TO_IDX['door'])
+        locked = fwd_state == STATE_TO_IDX['locked']
+        unlock = door & locked & (
+            (self.carrying[:, 0] == OBJECT_TO_IDX['key']) &
+            (self.carrying[:, 1] == fwd_cell[:, 1])
+        )
+        flip = door & ~locked
+        self._codes[self._env_idx[unlock], fwd_idx[unlock], 2] = STATE_TO_IDX['open']
+        self._codes[self._env_idx[flip], fwd_idx[flip], 2] = (
+            STATE_TO_IDX['open'] + STATE_TO_IDX['closed'] - fwd_state[flip]
+        )
+
+        # Boxes are replaced by their contents
+        box = sel & (fwd_type == OBJECT_TO_IDX['box'])
+        n, idx = self._env_idx[box], fwd_idx[box]
+        self._codes[n, idx] = self._contents[n, idx]
+        self._contents[n, idx] = EMPTY_ENCODING
+
+        dones |= self.step_count >= self.max_steps
+
+        for n in np.flatnonzero(dones):
+            self.envs[n].reset()
+            self._load(n)
+
+        obs = self.gen_obs()
+
+        return obs, rewards, dones, [{} for _ in range(self.num_envs)]
+
+    def gen_obs(self):
+        """
+        Generate the observations of all the agents, stacked along the
+        first axis, as MiniGridEnv.gen_obs() does for a single agent
+        """
+
+        size = self.agent_view_size
+        num_cells = self.width * self.height
+
+        # Gather the cells of each view from the flattened world planes
+        rotations = (self.agent_dir + 1) % 4
+        tops = self.agent_pos + self._view_tops[self.agent_dir]
+        xs = self._view_dx[rotations] + tops[:, 0, np.newaxis, np.newaxis]
+        ys = self._view_dy[rotations] + tops[:, 1, np.newaxis, np.newaxis]
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        idx = np.where(inside, xs * self.height + ys, num_cells)
+        idx += (self._env_idx * (num_cells + 1))[:, np.newaxis, np.newaxis]
+
+        view = self._view_buf
+        np.take(self._codes.reshape(-1, 3), idx, axis=0, out=view)
+
+        agent_pos = (size // 2, size - 1)
+
+        # Process occluders and visibility
+        vis_mask = batch_vis_mask(OPAQUE[view[..., 0], view[..., 2]], agent_pos)
+        vis_mask[self.see_through_walls] = True
+
+        # Make it so the agents see what they're carrying
+        view[:, agent_pos[0], agent_pos[1]] = self.carrying
+
+        image = np.zeros((self.num_envs, size, size, 3), dtype='uint8')
+        np.copyto(image, view, where=vis_mask[..., np.newaxis])
+
+        obs = {
+            'image': image,
+            'direction': self.agent_dir.copy(),
+            'mission': list(self.missions)
+        }
+
+        return obs
+
+    def render(self, tile_size=8, out=None):
+        """
+        Render the whole grids of all the environments, without highlighting
+        the agent views, into a single (N, height, width, 3) buffer. These
+        are the images RGBImgObsWrapper gives for each environment.
+        """
+
+        return Grid.render_batch(
+            self.planes,
+            tile_size,
+            self.agent_pos,
+            self.agent_dir,
+            self.carrying,
+            out=out
+        )
+
+    def get_obs_render(self, images, tile_size=TILE_PIXELS//2, out=None):
+        """
+        Render a batch of agent observations into a single (N, height, width, 3)
+        buffer. These are the images RGBImgPartialObsWrapper gives for each
+        environment.
+        """
+
+        size = self.agent_view_size
+
+        return Grid.render_batch(
+            images,
+            tile_size,
+            agent_pos=(size // 2, size - 1),
+            agent_dir=3,
+            highlight_masks=images[..., 0] != OBJECT_TO_IDX['unseen'],
+            out=out
+        )
+
+def _layout_offsets(layout, num_envs):
+    """
+    Compute the offsets in a shared memory block of the arrays described
+    by a list of (key, shape, dtype) entries, with one row per environment,
+    along with the total size of the block
+    """
+
+    offsets = []
+    size = 0
+
+    for key, shape, dtype in layout:
+        offsets.append(size)
+        nbytes = num_envs * int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        # Keep the arrays aligned on 8 bytes
+        size += -(-nbytes // 8) * 8
+
+    return offsets, max(size, 1)
+
+def _shared_arrays(buf, layout, num_envs):
+    """
+    Create the arrays described by a layout over a shared memory buffer
+    """
+
+    offsets, _ = _layout_offsets(layout, num_envs)
+
+    return {
+        key: np.ndarray((num_envs,) + shape, dtype=dtype, buffer=buf, offset=offset)
+        for (key, shape, dtype), offset in zip(layout, offsets)
+    }
+
+def _subproc_worker(remote, parent_remote, env_fn, index, shm_name, layout, num_envs):
+    parent_remote.close()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = _shared_arrays(shm.buf, layout, num_envs)
+    env = env_fn()
+    mission = None
+
+    def write(obs, reward=0, done=False):
+        """
+        Write an observation into the shared arrays, and return what
+        has to be sent through the pipe instead
+        """
+
+        nonlocal mission
+
+        arrays['reward'][index] = reward
+        arrays['done'][index] = done
+
+        if not isinstance(obs, dict):
+            arrays['obs'][index] = obs
+            return None, None
+
+        extras = {}
+        for key, value in obs.items():
+            if 'obs.' + key in arrays:
+                arrays['obs.' + key][index] = value
+            elif key != 'mission':
+                extras[key] = value
+
+        # The mission only changes when the environment is reset
+        new_mission = None
+        if 'mission' in obs and obs['mission'] != mission:
+            mission = new_mission = obs['mission']
+
+        return new_mission, extras or None
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+
+            if cmd == 'step':
+                obs, reward, done, info = env.step(data)
+                if done:
+                    obs = env.reset()
+                remote.send(write(obs, reward, done) + (info or None,))
+            elif cmd == 'reset':
+                mission = None
+                remote.send(write(env.reset()) + (None,))
+            elif cmd == 'seed':
+                remote.send(env.seed(data))
+            elif cmd == 'close':
+                break
+            else:
+                assert False, "unknown command"
+    except Exception as e:
+        remote.send(e)
+    finally:
+        del arrays
+        shm.close()
+        env.close()
+        remote.close()
+
+class SubprocMiniGrid:
+    """
+    Vector of environments stepped in worker processes. The workers write
+    the observations, rewards and done flags straight into a shared memory
+    block laid out from the observation space, so only the actions cross
+    the pipes, along with the missions when they change and anything the
+    shared arrays can't hold (non-empty infos, extra observation keys).
+
+    Environments reaching the end of an episode are reset by their worker,
+    and the observations returned for them are the first ones of the next
+    episode. The returned arrays are views of the shared block, and are
+    overwritten by the next call to step() or reset().
+    """
+
+    def __init__(self, env_fns, context=None):
+        self.num_envs = len(env_fns)
+        assert self.num_envs > 0
+
+        # Get the spaces from an instance of the first environment
+        env = env_fns[0]()
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+
+        # The direction isn't part of the observation space, only shared
+        # if the environment observes it
+        has_direction = (
+            isinstance(self.observation_space, spaces.Dict) and
+            'direction' not in self.observation_space.spaces and
+            'direction' in env.reset()
+        )
+        env.close()
+
+        if isinstance(self.observation_space, spaces.Dict):
+            layout = [
+                ('obs.' + key, space.shape, space.dtype)
+                for key, space in self.observation_space.spaces.items()
+                if isinstance(space, spaces.Box)
+            ]
+            if has_direction:
+                layout.append(('obs.direction', (), np.int64))
+        else:
+            assert isinstance(self.observation_space, spaces.Box)
+            layout = [('obs', self.observation_space.shape, self.observation_space.dtype)]
+        layout.append(('reward', (), np.float64))
+        layout.append(('done', (), np.bool_))
+
+        _, size = _layout_offsets(layout, self.num_envs)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._arrays = _shared_arrays(self._shm.buf, layout, self.num_envs)
+        self._missions = [None] * self.num_envs
+        self.closed = False
+
+        ctx = multiprocessing.get_context(context)
+        self._remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(self.num_envs)])
+        self._processes = []
+
+        for index, (work_remote, remote, env_fn) in enumerate(
+            zip(work_remotes, self._remotes, env_fns)
+        ):
+            process = ctx.Process(
+                target=_subproc_worker,
+                args=(
+                    work_remote,
+                    remote,
+                    env_fn,
+                    index,
+                    self._shm.name,
+                    layout,
+                    self.num_envs
+                ),
+                daemon=True
+            )
+            process.start()
+            work_remote.close()
+            self._processes.append(process)
+
+    def _recv_all(self):
+        results = [remote.recv() for remote in self._remotes]
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        return results
+
+    def _gather(self, results):
+        """
+        Assemble the observations from the shared arrays and the data
+        sent through the pipes
+        """
+
+        if 'obs' in self._arrays:
+            return self._arrays['obs']
+
+        obs = {
+            key[len('obs.'):]: array
+            for key, array in self._arrays.items()
+            if key.startswith('obs.')
+        }
+
+        for n, (mission, extras, _) in enumerate(results):
+            if mission is not None:
+                self._missions[n] = mission
+            for key, value in (extras or {}).items():
+                obs.setdefault(key, [None] * self.num_envs)[n] = value
+
+        obs['mission'] = list(self._missions)
+
+        return obs
+
+    def seed(self, seed=None):
+        """
+        Seed the environments with consecutive seeds
+        """
+
+        for n, remote in enumerate(self._remotes):
+            remote.send(('seed', None if seed is None else seed + n))
+
+        return [seeds[0] for seeds in self._recv_all()]
+
+    def reset(self):
+        for remote in self._remotes:
+            remote.send(('reset', None))
+
+        return self._gather(self._recv_all())
+
+    def step_async(self, actions):
+        for remote, action in zip(self._remotes, actions):
+            remote.send(('step', int(action)))
+
+    def step_wait(self):
+        results = self._recv_all()
+        obs = self._gather(results)
+        infos = [info or {} for _, _, info in results]
+
+        return obs, self._arrays['reward'], self._arrays['done'], infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        for remote in self._remotes:
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self._processes:
+            process.join()
+
+        # The block can only be closed once no array refers to it
+        self._arrays = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+        self._shm.unlink()
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
@@ -1,11 +1,13 @@
 import math
 import operator
+from collections import OrderedDict
 from functools import reduce
 
 import numpy as np
 import gym
 from gym import error, spaces, utils
-from .minigrid import OBJECT_TO_IDX, COLOR_TO_IDX, STATE_TO_IDX
+from .minigrid import OBJECT_TO_IDX, COLOR_TO_IDX, STATE_TO_IDX, ONE_HOT_BITS, one_hot_encode
+from .counts import CountTable, HashedCountTable, combine_key
 
 class ReseedWrapper(gym.core.Wrapper):
     """
@@ -35,26 +37,43 @@ class ActionBonus(gym.core.Wrapper):
     Wrapper which adds an exploration bonus.
     This is a reward to encourage exploration of less
     visited (state,action) pairs.
+    States are given by the agent position and direction, or by
+    the hash of the whole environment state with full_state=True.
+    Counts are kept in a CountTable, or a HashedCountTable with
+    full_state=True, which can be passed to share it between wrappers.
+    Actions outside of the action space, such as the intent-encoded
+    actions some environments accept, are counted in `extra_counts`.
     """
 
-    def __init__(self, env):
+    def __init__(self, env, full_state=False, counts=None):
         super().__init__(env)
-        self.counts = {}
+        self.full_state = full_state
+        self.num_actions = env.action_space.n
+
+        if counts is None:
+            if full_state:
+                counts = HashedCountTable()
+            else:
+                env = self.unwrapped
+                counts = CountTable((env.width, env.height, 4, self.num_actions))
+        self.counts = counts
+        self.extra_counts = HashedCountTable(capacity=1 << 10)
 
     def step(self, action):
         obs, reward, done, info = self.env.step(action)
 
-        env = self.unwrapped
-        tup = (tuple(env.agent_pos), env.agent_dir, action)
-
-        # Get the count for this (s,a) pair
-        pre_count = 0
-        if tup in self.counts:
-            pre_count = self.counts[tup]
-
         # Update the count for this (s,a) pair
-        new_count = pre_count + 1
-        self.counts[tup] = new_count
+        env = self.unwrapped
+        if self.full_state:
+            new_count = self.counts.increment(combine_key(env.state_hash(), int(action)))
+        elif 0 <= action < self.num_actions:
+            new_count = self.counts.increment(
+                (env.agent_pos[0], env.agent_pos[1], env.agent_dir, action)
+            )
+        else:
+            x, y = env.agent_pos
+            key = (int(x) * env.height + int(y)) * 4 + env.agent_dir
+            new_count = self.extra_counts.increment(combine_key(key, int(action)))
 
         bonus = 1 / math.sqrt(new_count)
         reward += bonus
@@ -67,29 +86,32 @@ class ActionBonus(gym.core.Wrapper):
 class StateBonus(gym.core.Wrapper):
     """
     Adds an exploration bonus based on which positions
-    are visited on the grid.
+    are visited on the grid, or which states are visited
+    with full_state=True. Counts are kept as in ActionBonus.
     """
 
-    def __init__(self, env):
+    def __init__(self, env, full_state=False, counts=None):
         super().__init__(env)
-        self.counts = {}
+        self.full_state = full_state
+
+        if counts is None:
+            if full_state:
+                counts = HashedCountTable()
+            else:
+                env = self.unwrapped
+                counts = CountTable((env.width, env.height))
+        self.counts = counts
 
     def step(self, action):
         obs, reward, done, info = self.env.step(action)
 
-        # Tuple based on which we index the counts
+        # Update the count for this key
         # We use the position after an update
         env = self.unwrapped
-        tup = (tuple(env.agent_pos))
-
-        # Get the count for this key
-        pre_count = 0
-        if tup in self.counts:
-            pre_count = self.counts[tup]
-
-        # Update the count for this key
-        new_count = pre_count + 1
-        self.counts[tup] = new_count
+        if self.full_state:
+            new_count = self.counts.increment(env.state_hash())
+        else:
+            new_count = self.counts.increment((env.agent_pos[0], env.agent_pos[1]))
 
         bonus = 1 / math.sqrt(new_count)
         reward += bonus
@@ -114,42 +136,33 @@ class ImgObsWrapper(gym.core.ObservationWrapper):
 class OneHotPartialObsWrapper(gym.core.ObservationWrapper):
     """
     Wrapper to get a one-hot encoding of a partially observable
-    agent view as observation.
+    agent view as observation. The bits can be produced as another
+    dtype (e.g. float32), or packed into bytes with `packed`.
     """
 
-    def __init__(self, env, tile_size=8):
+    def __init__(self, env, tile_size=8, dtype='uint8', packed=False):
         super().__init__(env)
 
         self.tile_size = tile_size
+        self.dtype = dtype
+        self.packed = packed
 
         obs_shape = env.observation_space['image'].shape
 
         # Number of bits per cell
-        num_bits = len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + len(STATE_TO_IDX)
+        num_bits = ONE_HOT_BITS
+        if packed:
+            num_bits = (num_bits + 7) // 8
 
         self.observation_space.spaces["image"] = spaces.Box(
             low=0,
-            high=255,
+            high=255 if packed or np.dtype(dtype) == np.uint8 else 1,
             shape=(obs_shape[0], obs_shape[1], num_bits),
-            dtype='uint8'
+            dtype='uint8' if packed else dtype
         )
 
     def observation(self, obs):
-        img = obs['image']
-        out = np.zeros(self.observation_space['image'].shape, dtype='uint8')
-
-        for i in range(img.shape[0]):
-            for j in range(img.shape[1]):
-                type = img[i, j, 0]
-                color = img[i, j, 1]
-                state = img[i, j, 2]
-
-                out[i, j, type] = 1
-                out[i, j, len(OBJECT_TO_IDX) + color] = 1
-                out[i, j, len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + state] = 1
-
-        # obs["orig"] = img
-        obs["image"] = out
+        obs["image"] = one_hot_encode(obs['image'], dtype=self.dtype, packed=self.packed)
 
         return obs
 
@@ -167,34 +180,19 @@ class CustomOneHotPartialObsWrapper(gym.core.ObservationWrapper):
 
         obs_shape = env.observation_space['image'].shape
 
-        # Number of bits per cell
-        num_bits = len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + len(STATE_TO_IDX)
-
         self.observation_space.spaces["image"] = spaces.Box(
             low=0,
             high=255,
-            shape=(obs_shape[0], obs_shape[1], num_bits),
+            shape=(obs_shape[0], obs_shape[1], ONE_HOT_BITS),
             dtype='uint8'
         )
 
     def observation(self, obs):
-        img = obs['image']
-        out = np.zeros(self.observation_space['image'].shape, dtype='int8')
-
-        for i in range(img.shape[0]):
-            for j in range(img.shape[1]):
-                type = img[i, j, 0]
-                color = img[i, j, 1]
-                state = img[i, j, 2]
-
-                out[i, j, type] = 1
-                out[i, j, len(OBJECT_TO_IDX) + color] = 1
-                out[i, j, len(OBJECT_TO_IDX) + len(COLOR_TO_IDX) + state] = 1
+        out = one_hot_encode(obs['image'], dtype='int8')
 
         cw, ch = out.shape[0]//2, out.shape[1]//2
         out[cw, ch] = -out[cw, ch]
 
-        # obs["orig"] = img
         obs["image"] = out
 
         return obs
@@ -266,12 +264,21 @@ class RGBImgPartialObsWrapper(gym.core.ObservationWrapper):
             'image': rgb_img_partial
         }
 
+AGENT_IDX = OBJECT_TO_IDX['agent']
+
 class FullyObsWrapper(gym.core.ObservationWrapper):
     """
-    Fully observable gridworld using a compact grid encoding
+    Fully observable gridworld using a compact grid encoding. The grid
+    encoding is maintained by the grid as cells are set, observations
+    are copies of it with the agent drawn in.
+
+    The copy is kept in a buffer, which is only copied from the grid again
+    when the grid changes, otherwise the agent is moved within it. With
+    `reuseBuffer`, observations are that buffer, which callers must copy
+    if they keep observations around.
     """
 
-    def __init__(self, env):
+    def __init__(self, env, reuseBuffer=False):
         super().__init__(env)
 
         self.observation_space.spaces["image"] = spaces.Box(
@@ -281,70 +288,126 @@ class FullyObsWrapper(gym.core.ObservationWrapper):
             dtype='uint8'
         )
 
+        self.reuseBuffer = reuseBuffer
+        self.buffer = None
+
+        # Grid and grid version the buffer holds, with the cells of both
+        # viewed as rows, along with the row the agent is drawn in
+        self._grid = None
+        self._version = None
+        self._cells = None
+        self._grid_cells = None
+        self._agent_cell = None
+
     def observation(self, obs):
         env = self.unwrapped
-        full_grid = env.grid.encode()
+        grid = env.grid
+        version = grid.version
+        k = int(env.agent_pos[0]) * grid.height + int(env.agent_pos[1])
+
+        if grid is self._grid and version == self._version:
+            # Only the cell the agent was drawn in differs from the grid
+            if k != self._agent_cell:
+                self._cells[self._agent_cell] = self._grid_cells[self._agent_cell]
+        else:
+            planes = grid.planes
+            if self.buffer is None or self.buffer.shape != planes.shape:
+                self.buffer = np.empty_like(planes)
+                self._cells = self.buffer.reshape(-1, 3)
+            np.copyto(self.buffer, planes)
+            self._grid = grid
+            self._version = version
+            self._grid_cells = planes.reshape(-1, 3)
 
         carrying = 0 if env.carrying is None else OBJECT_TO_IDX[env.carrying.type]
-        full_grid[env.agent_pos[0]][env.agent_pos[1]] = np.array([
-            OBJECT_TO_IDX['agent'],
-            carrying,
-            env.agent_dir
-        ])
+        self._cells[k] = (AGENT_IDX, carrying, env.agent_dir)
+        self._agent_cell = k
 
         return {
             'mission': obs['mission'],
-            'image': full_grid
+            'image': self.buffer if self.reuseBuffer else self.buffer.copy()
         }
 
 class FlatObsWrapper(gym.core.ObservationWrapper):
     """
     Encode mission strings using a one-hot scheme,
-    and combine these with observed images into one flat array
+    and combine these with observed images into one flat array.
+
+    The encodings of the last `cacheSize` missions are kept. With
+    `reuseBuffer`, observations are written into the same array at each
+    step, which callers must copy if they keep observations around.
     """
 
-    def __init__(self, env, maxStrLen=96):
+    def __init__(self, env, maxStrLen=96, cacheSize=64, reuseBuffer=False):
         super().__init__(env)
 
         self.maxStrLen = maxStrLen
         self.numCharCodes = 27
+        self.cacheSize = cacheSize
+        self.reuseBuffer = reuseBuffer
 
         imgSpace = env.observation_space.spaces['image']
-        imgSize = reduce(operator.mul, imgSpace.shape, 1)
+        self.cachedArrays = OrderedDict()
+        self.resize(reduce(operator.mul, imgSpace.shape, 1))
+
+    def resize(self, imgSize):
+        """
+        Change the size of the images, along with the observation space
+        and the buffer observations are written into
+        """
+
+        self.imgSize = imgSize
 
         self.observation_space = spaces.Box(
             low=0,
             high=255,
-            shape=(1, imgSize + self.numCharCodes * self.maxStrLen),
+            shape=(1, self.imgSize + self.numCharCodes * self.maxStrLen),
             dtype='uint8'
         )
 
-        self.cachedStr = None
-        self.cachedArray = None
+        self.buffer = np.zeros(self.observation_space.shape[1], dtype=self.observation_space.dtype)
 
-    def observation(self, obs):
-        image = obs['image']
-        mission = obs['mission']
+    def encodeMission(self, mission):
+        """
+        One-hot encode the characters of a mission string, flattened
+        """
+
+        assert len(mission) <= self.maxStrLen, 'mission string too long ({} chars)'.format(len(mission))
+        mission = mission.lower()
 
-        # Cache the last-encoded mission string
-        if mission != self.cachedStr:
-            assert len(mission) <= self.maxStrLen, 'mission string too long ({} chars)'.format(len(mission))
-            mission = mission.lower()
+        strArray = np.zeros(shape=(self.maxStrLen, self.numCharCodes), dtype=self.buffer.dtype)
 
-            strArray = np.zeros(shape=(self.maxStrLen, self.numCharCodes), dtype='float32')
+        for idx, ch in enumerate(mission):
+            if ch >= 'a' and ch <= 'z':
+                chNo = ord(ch) - ord('a')
+            elif ch == ' ':
+                chNo = ord('z') - ord('a') + 1
+            assert chNo < self.numCharCodes, '%s : %d' % (ch, chNo)
+            strArray[idx, chNo] = 1
 
-            for idx, ch in enumerate(mission):
-                if ch >= 'a' and ch <= 'z':
-                    chNo = ord(ch) - ord('a')
-                elif ch == ' ':
-                    chNo = ord('z') - ord('a') + 1
-                assert chNo < self.numCharCodes, '%s : %d' % (ch, chNo)
-                strArray[idx, chNo] = 1
+        return strArray.reshape(-1)
 
-            self.cachedStr = mission
-            self.cachedArray = strArray
+    def observation(self, obs):
+        image = obs['image']
+        mission = obs['mission']
 
-        obs = np.concatenate((image.flatten(), self.cachedArray.flatten()))
+        # Cache the most recently encoded mission strings
+        strArray = self.cachedArrays.get(mission)
+        if strArray is None:
+            strArray = self.encodeMission(mission)
+            self.cachedArrays[mission] = strArray
+            if len(self.cachedArrays) > self.cacheSize:
+                self.cachedArrays.popitem(last=False)
+        else:
+            self.cachedArrays.move_to_end(mission)
+
+        # Some environments produce other images than they declare
+        if image.size != self.imgSize:
+            self.resize(image.size)
+
+        obs = self.buffer if self.reuseBuffer else np.empty_like(self.buffer)
+        obs[:self.imgSize] = image.reshape(-1)
+        obs[self.imgSize:] = strArray
 
         return obs
 
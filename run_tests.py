@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
+import copy
+import math
 import random
 import numpy as np
 import gym
 from gym_minigrid.register import env_list
-from gym_minigrid.minigrid import Grid, OBJECT_TO_IDX
+from gym_minigrid.minigrid import Grid, OBJECT_TO_IDX, Wall, Lava, Key, Door
 
 # Test specifically importing a specific environment
 from gym_minigrid.envs import DoorKeyEnv
@@ -48,6 +50,14 @@ for env_idx, env_name in enumerate(env_list):
         assert env.agent_pos[0] < env.width
         assert env.agent_pos[1] < env.height
 
+        # Check that the grid encoding matches the objects in the grid
+        full_img = env.grid.encode()
+        for i in range(env.grid.width):
+            for j in range(env.grid.height):
+                v = env.grid.get(i, j)
+                enc = v.encode() if v else (OBJECT_TO_IDX['empty'], 0, 0)
+                assert tuple(full_img[i, j]) == enc
+
         # Test observation encode/decode roundtrip
         img = obs['image']
         grid, vis_mask = Grid.decode(img)
@@ -151,3 +161,570 @@ for i in range(0, 500):
     assert agent_sees_goal == goal_visible
     if done:
         env.reset()
+
+##############################################################################
+
+print('testing BatchMiniGrid')
+from gym_minigrid.vector import BatchMiniGrid
+
+for env_name in ['MiniGrid-DoorKey-8x8-v0', 'MiniGrid-LavaCrossingS9N1-v0']:
+    batch = BatchMiniGrid([gym.make(env_name) for _ in range(4)])
+    batch.seed(0)
+    obs = batch.reset()
+
+    # Step copies of the batched environments one by one
+    envs = [copy.deepcopy(env) for env in batch.envs]
+
+    for i in range(0, 500):
+        actions = np.random.randint(0, len(batch.actions), size=4)
+        obs, rewards, dones, _ = batch.step(actions)
+
+        for k, env in enumerate(envs):
+            env_obs, reward, done, _ = env.step(actions[k])
+            assert reward == rewards[k]
+            assert done == dones[k]
+
+            # Done environments are reset by the batch
+            if done:
+                envs[k] = copy.deepcopy(batch.envs[k])
+                env_obs = envs[k].gen_obs()
+
+            assert np.array_equal(env_obs['image'], obs['image'][k])
+            assert env_obs['direction'] == obs['direction'][k]
+
+##############################################################################
+
+print('testing SubprocMiniGrid')
+from gym_minigrid.vector import SubprocMiniGrid
+
+env_name = 'MiniGrid-DoorKey-8x8-v0'
+vec_env = SubprocMiniGrid([lambda: gym.make(env_name) for _ in range(2)])
+vec_env.seed(0)
+obs = vec_env.reset()
+
+envs = [gym.make(env_name) for _ in range(2)]
+env_obs = []
+for k, env in enumerate(envs):
+    env.seed(k)
+    env_obs.append(env.reset())
+
+for i in range(0, 200):
+    for k in range(2):
+        assert np.array_equal(env_obs[k]['image'], obs['image'][k])
+        assert env_obs[k]['mission'] == obs['mission'][k]
+
+    actions = np.random.randint(0, vec_env.action_space.n, size=2)
+    obs, rewards, dones, _ = vec_env.step(actions)
+
+    for k, env in enumerate(envs):
+        env_obs[k], reward, done, _ = env.step(actions[k])
+        assert reward == rewards[k]
+        assert done == dones[k]
+        if done:
+            env_obs[k] = env.reset()
+
+vec_env.close()
+
+# Only the keys the environments observe are returned
+vec_env = SubprocMiniGrid([lambda: FullyObsWrapper(gym.make(env_name))])
+assert sorted(vec_env.reset().keys()) == ['image', 'mission']
+vec_env.close()
+
+##############################################################################
+
+print('testing TileAtlas')
+import tempfile
+from gym_minigrid.tiles import TileAtlas
+
+env = gym.make('MiniGrid-DoorKey-8x8-v0')
+env.reset()
+Grid.tile_cache.clear()
+img = env.render('rgb_array', tile_size=8)
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    TileAtlas.load_or_build(cache_dir, tile_size=8)
+    atlas = TileAtlas.load(cache_dir, tile_size=8).install()
+
+    # Rendering from the atlas gives the same images
+    Grid.tile_cache.clear()
+    assert np.array_equal(env.render('rgb_array', tile_size=8), img)
+    assert len(Grid.tile_cache) == 0
+
+    del Grid.tile_atlases[(8, 3)]
+    del atlas
+
+##############################################################################
+
+print('testing TileCache')
+from gym_minigrid.rendering import TileCache
+
+cache = TileCache(capacity=2)
+for k in range(3):
+    cache.put(k, np.zeros((4, 4, 3), dtype=np.uint8))
+assert cache.get(0) is None
+assert cache.get(2) is not None
+stats = cache.stats()
+assert stats['size'] == 2 and stats['evictions'] == 1
+assert stats['hits'] == 1 and stats['misses'] == 1
+assert stats['bytes'] == 2 * 4 * 4 * 3
+
+# Tiles of lazy atlases are kept in the bounded tile cache
+env = gym.make('MiniGrid-DoorKey-8x8-v0')
+env.reset()
+Grid.tile_cache.clear()
+img = env.grid.render(12, env.agent_pos, env.agent_dir)
+assert len(Grid.tile_cache) > 4
+Grid.tile_cache.clear()
+Grid.tile_cache.resize(4)
+evictions = Grid.tile_cache.evictions
+assert np.array_equal(env.grid.render(12, env.agent_pos, env.agent_dir), img)
+stats = Grid.tile_cache.stats()
+assert stats['size'] == 4 and stats['evictions'] > evictions
+assert stats['bytes'] == 4 * 12 * 12 * 3
+Grid.tile_cache.resize(1024)
+
+##############################################################################
+
+print('testing Grid.render_batch')
+
+envs = [gym.make('MiniGrid-DoorKey-8x8-v0') for _ in range(3)]
+obs = [env.reset() for env in envs]
+images = np.stack([o['image'] for o in obs])
+frames = np.zeros((3, 7 * 8, 7 * 8, 3), dtype=np.uint8)
+Grid.render_batch(
+    images,
+    8,
+    agent_pos=(3, 6),
+    agent_dir=3,
+    highlight_masks=images[..., 0] != OBJECT_TO_IDX['unseen'],
+    out=frames
+)
+for k, env in enumerate(envs):
+    assert np.array_equal(frames[k], env.get_obs_render(images[k], tile_size=8))
+
+# Buffers which are not contiguous are written too
+big = np.zeros((3, 7 * 8, 2 * 7 * 8, 3), dtype=np.uint8)
+Grid.render_batch(images, 8, agent_pos=(3, 6), agent_dir=3, out=big[:, :, ::2])
+frame = np.zeros((7 * 8, 2 * 7 * 8, 3), dtype=np.uint8)
+Grid.render_encoding(images[0], 8, agent_pos=(3, 6), agent_dir=3, out=frame[:, ::2])
+assert np.array_equal(big[0, :, ::2], frame[:, ::2])
+assert np.array_equal(big[0, :, ::2], Grid.render_encoding(images[0], 8, agent_pos=(3, 6), agent_dir=3))
+
+##############################################################################
+
+print('testing get_state/set_state')
+
+env = gym.make('MiniGrid-ObstructedMaze-2Dlhb-v0')
+env.reset()
+state = env.get_state()
+
+actions = [random.randint(0, env.action_space.n - 1) for _ in range(100)]
+trajectory = [env.step(action)[0]['image'] for action in actions]
+
+# Restoring the snapshot in a new episode replays the same trajectory
+env.reset()
+env.set_state(state)
+for action, img in zip(actions, trajectory):
+    obs, _, _, _ = env.step(action)
+    assert np.array_equal(obs['image'], img)
+
+##############################################################################
+
+print('testing Grid.copy')
+
+env = gym.make('MiniGrid-KeyCorridorS3R3-v0')
+grid = env.grid.copy()
+assert grid == env.grid
+
+# Doors are duplicated, walls are shared
+door = next(v for v in grid.grid if v and v.type == 'door')
+assert door not in env.grid
+assert grid.get(0, 0) is env.grid.get(0, 0)
+door.is_open = not door.is_open
+assert grid != env.grid
+
+##############################################################################
+
+print('testing state_hash')
+
+env = gym.make('MiniGrid-KeyCorridorS3R3-v0')
+env = StateBonus(env, full_state=True)
+env.reset()
+hashes = {}
+for i in range(0, 500):
+    action = random.randint(0, env.action_space.n - 1)
+    obs, reward, done, info = env.step(action)
+
+    # States with the same hash are the same
+    grid = env.grid.copy()
+    key = (grid.encode().tobytes(), tuple(env.agent_pos), env.agent_dir,
+           env.carrying.encode() if env.carrying else None)
+    assert hashes.setdefault(env.state_hash(), key) == key
+    assert grid.hash == env.grid.hash
+    if done:
+        env.reset()
+
+# State hashes are the same in all processes
+import subprocess
+import sys
+
+hash_script = """
+import gym
+import gym_minigrid
+from gym_minigrid.minigrid import Key
+env = gym.make('MiniGrid-DoorKey-8x8-v0')
+env.seed(1)
+env.reset()
+hashes = [env.state_hash()]
+for action in [0, 2, 1, 2, 2]:
+    env.step(action)
+    hashes.append(env.state_hash())
+env.carrying = Key('yellow')
+hashes.append(env.state_hash())
+print(hashes)
+"""
+outputs = [subprocess.check_output([sys.executable, '-c', hash_script]) for _ in range(2)]
+assert outputs[0] == outputs[1]
+hashes = eval(outputs[0])
+assert len(set(hashes[-2:])) == 2 and all(0 <= h < 2 ** 64 for h in hashes)
+
+##############################################################################
+
+print('testing shared objects')
+
+grid = Grid(5, 5)
+grid.wall_rect(0, 0, 5, 5)
+assert grid.get(0, 0) is grid.get(4, 4) is Wall.shared()
+assert Lava.shared() is not Lava.shared('blue')
+assert not hasattr(Key('red'), '__dict__')
+
+##############################################################################
+
+print('testing free cell placement')
+
+env = gym.make('MiniGrid-Playground-v0')
+env.placement = 'free_cells'
+for seed in range(5):
+    env.seed(seed)
+    env.reset()
+    grid1 = env.grid
+    env.seed(seed)
+    env.reset()
+    grid2 = env.grid
+    assert grid1 == grid2
+
+    # Objects are never placed over each other or over the agent
+    objs = [v for v in grid2.grid if v and v.type in ['key', 'ball', 'box']]
+    assert len(objs) == 12
+    assert grid2.get(*env.agent_pos) is None
+
+##############################################################################
+
+print('testing LayoutCache')
+from gym_minigrid.layouts import LayoutCache
+
+cache = LayoutCache(capacity=2)
+env = gym.make('MiniGrid-KeyCorridorS3R3-v0')
+env2 = cache.install(ReseedWrapper(gym.make('MiniGrid-KeyCorridorS3R3-v0'), seeds=[0, 1]))
+for i in range(6):
+    env.seed(i % 2)
+    obs1 = env.reset()
+    obs2 = env2.reset()
+    assert np.array_equal(obs1['image'], obs2['image'])
+    assert obs1['mission'] == obs2['mission']
+    assert env.grid == env2.grid
+    for _ in range(20):
+        action = random.randint(0, env.action_space.n - 1)
+        obs1, _, _, _ = env.step(action)
+        obs2, _, _, _ = env2.step(action)
+        assert np.array_equal(obs1['image'], obs2['image'])
+assert cache.stats()['hits'] == 4
+
+# The rooms of a cached layout hold the objects of the restored grid
+env2.seed(0)
+env2.reset()
+doors = [d for row in env2.room_grid for room in row for d in room.doors if isinstance(d, Door)]
+assert doors and all(env2.grid.get(*d.cur_pos) is d for d in doors)
+
+env = cache.install(gym.make('MiniGrid-LockedRoom-v0'))
+for seed in [0, 1, 0]:
+    env.seed(seed)
+    env.reset()
+    assert all(env.grid.get(*room.doorPos).is_locked == room.locked for room in env.rooms)
+
+##############################################################################
+
+print('testing LayoutPool')
+from gym_minigrid.layouts import LayoutPool
+
+env_name = 'MiniGrid-MultiRoom-N4-S5-v0'
+pool = LayoutPool(lambda: gym.make(env_name), range(5), num_workers=2, size=3)
+env = gym.make(env_name)
+env2 = pool.install(gym.make(env_name))
+for seed in [0, 1, 3, 4, 7]:
+    env.seed(seed)
+    obs1 = env.reset()
+    env2.seed(seed)
+    obs2 = env2.reset()
+    assert np.array_equal(obs1['image'], obs2['image'])
+    assert env.grid == env2.grid
+    for _ in range(20):
+        action = random.randint(0, env.action_space.n - 1)
+        obs1, _, _, _ = env.step(action)
+        obs2, _, _, _ = env2.step(action)
+        assert np.array_equal(obs1['image'], obs2['image'])
+stats = pool.stats()
+assert stats['hits'] == 4 and stats['skipped'] == 1 and stats['misses'] == 1
+pool.close()
+
+##############################################################################
+
+print('testing one_hot_encode')
+from gym_minigrid.minigrid import one_hot_encode
+
+env = gym.make('MiniGrid-KeyCorridorS3R3-v0')
+img = env.grid.encode()
+out = one_hot_encode(img)
+for i in range(img.shape[0]):
+    for j in range(img.shape[1]):
+        type, color, state = img[i, j]
+        bits = np.flatnonzero(out[i, j]).tolist()
+        assert bits == [type, len(OBJECT_TO_IDX) + color, out.shape[2] - 3 + state]
+assert np.array_equal(one_hot_encode(img, packed=True), np.packbits(out, axis=-1))
+assert np.array_equal(one_hot_encode(img, dtype='float32'), out)
+
+##############################################################################
+
+print('testing FullyObsWrapper')
+
+env = FullyObsWrapper(gym.make('MiniGrid-KeyCorridorS3R3-v0'))
+obs = env.reset()
+for i in range(0, 200):
+    action = random.randint(0, env.action_space.n - 1)
+    obs, reward, done, info = env.step(action)
+
+    # The observation is the grid encoding with the agent drawn in
+    img = obs['image'].copy()
+    x, y = env.agent_pos
+    assert img[x, y, 0] == OBJECT_TO_IDX['agent'] and img[x, y, 2] == env.agent_dir
+    img[x, y] = env.grid.planes[x, y]
+    assert np.array_equal(img, env.grid.encode())
+    if done:
+        env.reset()
+
+# Observations written into the same buffer follow the changes of the grid
+env = FullyObsWrapper(gym.make('MiniGrid-KeyCorridorS3R3-v0'))
+env2 = FullyObsWrapper(gym.make('MiniGrid-KeyCorridorS3R3-v0'), reuseBuffer=True)
+for seed in range(3):
+    env.seed(seed)
+    env2.seed(seed)
+    obs1 = env.reset()
+    obs2 = env2.reset()
+    assert obs2['image'] is env2.buffer
+    for i in range(0, 100):
+        action = random.randint(0, env.action_space.n - 1)
+        obs1, _, done, _ = env.step(action)
+        obs2, _, _, _ = env2.step(action)
+        assert np.array_equal(obs1['image'], obs2['image'])
+        if done:
+            break
+    state = env2.get_state()
+    obs2 = env2.observation(env2.reset())
+    env2.set_state(state)
+    assert np.array_equal(env2.observation(obs2)['image'], obs1['image'])
+
+##############################################################################
+
+print('testing FlatObsWrapper')
+
+env = FlatObsWrapper(gym.make('MiniGrid-Fetch-8x8-N3-v0'), cacheSize=4, reuseBuffer=True)
+for seed in range(10):
+    env.seed(seed)
+    obs = env.reset()
+    assert obs is env.buffer and obs.dtype == env.observation_space.dtype
+    assert np.array_equal(obs[:env.imgSize], env.unwrapped.gen_obs()['image'].reshape(-1))
+    assert obs[env.imgSize:].sum() == len(env.unwrapped.mission)
+assert len(env.cachedArrays) <= 4
+
+# The observation space follows the size of the images actually observed
+env = FlatObsWrapper(gym.make('MiniGrid-Empty-8x8-v0'), reuseBuffer=True)
+env.unwrapped.agent_view_size = 5
+obs = env.reset()
+assert env.imgSize == 5 * 5 * 3 and obs.size == env.observation_space.shape[1]
+assert env.observation_space.contains(obs.reshape(env.observation_space.shape))
+
+##############################################################################
+
+print('testing count tables')
+import os
+from gym_minigrid.counts import CountTable, HashedCountTable, combine_key
+
+env = ActionBonus(gym.make('MiniGrid-MultiRoom-N6-v0'))
+env2 = StateBonus(gym.make('MiniGrid-MultiRoom-N6-v0'), full_state=True)
+env.reset()
+env2.reset()
+for i in range(0, 500):
+    action = random.randint(0, 2)
+    _, reward, done, _ = env.step(action)
+    x, y = env.agent_pos
+    assert reward == 1 / math.sqrt(env.counts[x, y, env.agent_dir, action])
+    _, reward, done2, _ = env2.step(action)
+    assert reward == 1 / math.sqrt(env2.counts[env2.state_hash()])
+    if done:
+        env.reset()
+    if done2:
+        env2.reset()
+assert env.counts.total() == env2.counts.total() == 500
+
+# Intent-encoded actions are counted apart from the action space
+np.random.seed(0)
+env = ActionBonus(gym.make('MiniGrid-GridRooms-v0'))
+env.seed(0)
+env.reset()
+for action in [112, 110, 112, 2]:
+    _, reward, _, _ = env.step(action)
+    x, y = env.agent_pos
+    if action < env.num_actions:
+        count = env.counts[x, y, env.agent_dir, action]
+    else:
+        key = (int(x) * env.height + int(y)) * 4 + env.agent_dir
+        count = env.extra_counts[combine_key(key, action)]
+    assert count > 0 and 0 <= reward - 1 / math.sqrt(count) <= 1
+assert env.extra_counts.total() == 3 and env.counts.total() == 1
+
+with tempfile.TemporaryDirectory() as save_dir:
+    path = os.path.join(save_dir, 'counts.npz')
+    env2.counts.save(path)
+    counts = HashedCountTable.load(path)
+    counts.merge(env2.counts)
+    assert len(counts) == len(env2.counts)
+    assert counts.total() == 1000
+
+# Tables of state hashes saved by another process count the same states
+count_script = """
+import random
+import sys
+import gym
+import gym_minigrid
+from gym_minigrid.wrappers import StateBonus
+env = StateBonus(gym.make('MiniGrid-DoorKey-8x8-v0'), full_state=True)
+env.seed(3)
+env.reset()
+rng = random.Random(3)
+for _ in range(100):
+    env.step(rng.randint(0, 5))
+env.counts.save(sys.argv[1])
+"""
+with tempfile.TemporaryDirectory() as save_dir:
+    path = os.path.join(save_dir, 'counts.npz')
+    subprocess.check_call([sys.executable, '-c', count_script, path])
+    counts = HashedCountTable.load(path)
+    env = StateBonus(gym.make('MiniGrid-DoorKey-8x8-v0'), full_state=True)
+    env.seed(3)
+    env.reset()
+    rng = random.Random(3)
+    for _ in range(100):
+        env.step(rng.randint(0, 5))
+    assert sorted(counts.items()) == sorted(env.counts.items())
+
+##############################################################################
+
+print('testing shared count tables')
+from gym_minigrid.shared_counts import SharedCountTable, SharedHashedCountTable, CountSnapshotter
+
+env_name = 'MiniGrid-MultiRoom-N2-S4-v0'
+env = gym.make(env_name)
+counts = SharedCountTable((env.width, env.height))
+vec_env = SubprocMiniGrid([lambda: StateBonus(gym.make(env_name), counts=counts) for _ in range(2)])
+vec_env.seed(0)
+vec_env.reset()
+for i in range(0, 100):
+    vec_env.step(np.random.randint(0, 3, size=2))
+vec_env.close()
+
+# The workers incremented the counts of the table in this process,
+# concurrent increments of the same position may be lost
+assert 0 < counts.total() <= 200
+
+with tempfile.TemporaryDirectory() as save_dir:
+    path = os.path.join(save_dir, 'counts.npz')
+    snapshotter = CountSnapshotter(counts, path, interval=3600)
+    snapshotter.stop()
+    assert np.array_equal(CountTable.load(path).counts, counts.counts)
+counts.close()
+
+# Separately started processes attach by name without freeing the
+# blocks when they exit
+counts = SharedCountTable((4,))
+hashed_counts = SharedHashedCountTable(capacity=16)
+attach_script = """
+import sys
+from gym_minigrid.shared_counts import SharedCountTable, SharedHashedCountTable
+counts = SharedCountTable((4,), name=sys.argv[1])
+counts.increment(1)
+counts.close()
+counts = SharedHashedCountTable(capacity=16, name=sys.argv[2])
+counts.increment(123)
+counts.close()
+"""
+for _ in range(2):
+    subprocess.check_call([sys.executable, '-c', attach_script, counts.name, hashed_counts.name])
+assert counts[1] == 2 and hashed_counts[123] == 2
+counts.close()
+hashed_counts.close()
+
+counts = SharedHashedCountTable(capacity=4)
+for key in range(4):
+    counts.increment(key)
+try:
+    counts.increment(4)
+    assert False
+except RuntimeError:
+    pass
+counts.close()
+
+##############################################################################
+
+print('testing custom objects')
+from gym_minigrid.minigrid import WorldObj
+
+class Lamp(WorldObj):
+    def __init__(self):
+        super().__init__('ball', 'red')
+        self.on = False
+
+    def toggle(self, env, pos):
+        self.on = not self.on
+        self.color = 'yellow' if self.on else 'red'
+        return True
+
+# Objects defined outside of the package are re-encoded when they change
+grid = Grid(5, 5)
+lamp = Lamp()
+grid.set(2, 2, lamp)
+grid_hash = grid.hash
+lamp.toggle(None, (2, 2))
+assert tuple(grid.encode()[2, 2]) == lamp.encode()
+assert grid.hash != grid_hash
+
+# Attributes of custom objects survive grid copies
+lamp.toggle(None, (2, 2))
+lamp.toggle(None, (2, 2))
+grid2 = grid.copy()
+assert grid2.get(2, 2) is not lamp and grid2.get(2, 2).on
+assert grid2 == grid
+
+# Mutable objects of a type whose builtin objects never change are copied
+class FloorLamp(Lamp):
+    def __init__(self):
+        WorldObj.__init__(self, 'floor', 'red')
+        self.on = False
+
+lamp = FloorLamp()
+grid.set(1, 1, lamp)
+grid2 = grid.copy()
+assert grid2.get(1, 1) is not lamp
+lamp.toggle(None, (1, 1))
+assert grid2.get(1, 1).color == 'red' and grid2 != grid
+grid2.get(1, 1).toggle(None, (1, 1))
+assert tuple(grid2.encode()[1, 1]) == lamp.encode() and grid2 == grid